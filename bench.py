@@ -0,0 +1,726 @@
+import io
+import os
+import re
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import zlib
+import gzip
+from string import Template
+from contextlib import redirect_stdout
+from difflib import get_close_matches
+from typing import Dict, List
+from urllib.parse import quote, urlsplit, unquote
+
+import yaml
+from lxml import etree
+from requests import Response
+from requests.adapters import BaseAdapter
+
+import core
+import spiders
+from exts import (CodenameExtractor, CodenameMatcher, YamlLoader, set_mark,
+                  dump_info, load_info, load_codename, setup_log, close_log)
+from stats import stats
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                           'fixtures')
+ACTORS = [f'演員{i:03d}' for i in range(200)]
+TAGS = ['單體作品', '巨乳', '高畫質', '中文字幕', '獨佔配信', '企畫', '素人', '4K']
+
+PREFIXES = ['SSIS', 'ABP', 'IPX', 'MIDE', 'STARS', 'JUL', 'SNIS', 'PRED']
+SITES = ['hhd800.com@', '[thz.la]', 'www.98t.la@', '']
+SUFFIXES = ['', '-C', '_uncensored', '-4K', 'ch']
+
+
+def fake_filenames(count: int, seed: int = 0) -> List[str]:
+    # 生成接近真实下载命名的文件名: 普通番号/FC2/无码番号混合
+    rnd = random.Random(seed)
+    names = list()
+    for i in range(count):
+        kind = rnd.random()
+        if kind < 0.7:
+            code = f'{rnd.choice(PREFIXES)}-{rnd.randint(1, 999):03d}'
+        elif kind < 0.9:
+            code = f'FC2-PPV-{rnd.randint(1000000, 3999999)}'
+        else:
+            code = f'{rnd.randint(10120, 123199):06d}-{rnd.randint(1, 999):03d}'
+        names.append(
+            f'{rnd.choice(SITES)}{code}{rnd.choice(SUFFIXES)}.mp4')
+    return names
+
+
+def make_media_tree(root: str, count: int, seed: int = 0) -> List[str]:
+    # 模拟下载目录: 部分文件位于以番号命名的子目录中, 部分直接散落在批次目录下
+    rnd = random.Random(seed)
+    paths = list()
+    for i, name in enumerate(fake_filenames(count, seed)):
+        parent = os.path.join(root, f'batch{i // 1000:03d}')
+        if rnd.random() < 0.6:
+            parent = os.path.join(parent, os.path.splitext(name)[0])
+        os.makedirs(parent, exist_ok=True)
+        path = os.path.join(parent, name)
+        with open(path, 'wb'):
+            pass
+        paths.append(path)
+    return paths
+
+
+class FixtureAdapter(BaseAdapter):
+    # 根据请求路径, 用fixtures目录下的页面模板生成搜索页与详情页
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+        # 实际传输的字节数(按请求头压缩, 304时为0)
+        self.sent = 0
+        self.templates: Dict[str, Template] = dict()
+        for filename in os.listdir(FIXTURE_DIR):
+            with open(os.path.join(FIXTURE_DIR, filename),
+                      'r',
+                      encoding='utf-8') as fp:
+                self.templates[os.path.splitext(filename)[0]] = Template(
+                    fp.read())
+
+    def movie(self, codename: str) -> dict:
+        rnd = random.Random(zlib.crc32(codename.encode()))
+        return dict(codename=codename,
+                    title=f'{codename} 的標題',
+                    director=f'導演{rnd.randint(0, 49):02d}',
+                    actors=rnd.sample(ACTORS, rnd.randint(1, 3)),
+                    tags=rnd.sample(TAGS, rnd.randint(1, 4)))
+
+    def render(self, name: str, **kwargs) -> str:
+        return self.templates[name].substitute(**kwargs)
+
+    def listing(self, link: str, page: int) -> List[str]:
+        # 演员列表页: 每页20部, 共3页, 番号由演员编号决定
+        if page > 3:
+            return list()
+        seed = zlib.crc32(link.encode())
+        return [
+            f'{PREFIXES[(seed + k) % len(PREFIXES)]}-'
+            f'{(seed + page * 211 + k * 7) % 999 + 1:03d}' for k in range(20)
+        ]
+
+    def javbus(self, path: str) -> str | None:
+        if path.startswith('/star/'):
+            parts = path.split('/')
+            codes = self.listing('/'.join(parts[:3]),
+                                 int(parts[3]) if len(parts) > 3 else 1)
+            if not codes:
+                return None
+            items = ''.join(
+                self.render('javbus_item', codename=code, title=f'{code} 的標題')
+                for code in codes)
+            return self.render('javbus_search', query=path, items=items)
+        if path.startswith('/search/') or path.startswith(
+                '/uncensored/search/'):
+            query = path.rsplit('/', 1)[-1]
+            items = ''.join(
+                self.render('javbus_item', codename=code, title=f'{code} 的標題')
+                for code in (query.upper(), f'{query.upper()}R'))
+            return self.render('javbus_search', query=query, items=items)
+        movie = self.movie(path.strip('/'))
+        tags = ''.join(
+            f'<span class="genre"><label><input type="checkbox">'
+            f'<a href="/genre/{i}">{tag}</a></label></span>'
+            for i, tag in enumerate(movie['tags']))
+        actors = ''.join(f'<span class="genre"><a href="/star/'
+                         f'{ACTORS.index(actor)}">{actor}</a></span>'
+                         for actor in movie['actors'])
+        return self.render('javbus_detail',
+                           codename=movie['codename'],
+                           title=movie['title'],
+                           director=movie['director'],
+                           tags=tags,
+                           actors=actors)
+
+    def javdb(self, path: str, query: str) -> str | None:
+        if path == '/search':
+            text = unquote(query.split('=', 1)[-1]).upper()
+            items = ''.join(
+                self.render('javdb_item',
+                            uri=code,
+                            codename=code,
+                            title=f'{code} 的標題')
+                for code in (text, f'{text}R'))
+            return self.render('javdb_search', query=text, items=items)
+        if path.startswith('/actors/'):
+            page = int(query.split('=', 1)[-1]) if query else 1
+            items = ''.join(
+                self.render('javdb_item',
+                            uri=code,
+                            codename=code,
+                            title=f'{code} 的標題')
+                for code in self.listing(path, page))
+            return self.render('javdb_search', query=path, items=items)
+        if not path.startswith('/v/'):
+            return None
+        movie = self.movie(path[3:])
+        tags = ', '.join(f'<a href="/tags?c{i}">{tag}</a>'
+                         for i, tag in enumerate(movie['tags']))
+        actors = ''.join(f'<a href="/actors/{ACTORS.index(actor)}">{actor}</a>'
+                         f'<strong class="symbol female">♀</strong>&nbsp;'
+                         for actor in movie['actors'])
+        actors += '<a href="/actors/m">男優</a><strong class="symbol male">♂</strong>'
+        return self.render('javdb_detail',
+                           codename=movie['codename'],
+                           title=movie['title'],
+                           director=movie['director'],
+                           tags=tags,
+                           actors=actors)
+
+    def send(self, request, **kwargs) -> Response:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(request.url)
+        path = unquote(url.path)
+        if 'javbus' in url.netloc:
+            body = self.javbus(path)
+        else:
+            body = self.javdb(path, url.query)
+        response = Response()
+        response.url = request.url
+        response.request = request
+        response.status_code = 404 if body is None else 200
+        response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        response._content = (body or '').encode('utf-8')
+        response.encoding = 'utf-8'
+        wire = response._content
+        if body is not None:
+            # 页面内容不变则ETag不变, 与请求头中的校验信息一致时返回304
+            etag = f'"{zlib.crc32(response._content):08x}"'
+            response.headers['ETag'] = etag
+            if request.headers.get('If-None-Match') == etag:
+                response.status_code = 304
+                response._content = wire = b''
+            elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+                response.headers['Content-Encoding'] = 'gzip'
+                wire = gzip.compress(wire, 6)
+        self.sent += len(wire)
+        response.raw = io.BytesIO(wire)
+        response.raw.seek(0, io.SEEK_END)
+        return response
+
+    def close(self):
+        pass
+
+
+def check_info(info: dict, expected: dict) -> List[str]:
+    # 返回与页面模板数据不一致的字段; javbus 的标题不含番号
+    wrong = [
+        key for key in ('codename', 'director')
+        if info.get(key) != expected[key]
+    ] + [
+        key for key in ('actors', 'tags')
+        if sorted(info.get(key) or ()) != sorted(expected[key])
+    ]
+    title = expected['title']
+    if info.get('title') not in (title, title.replace(expected['codename'],
+                                                      '', 1).strip()):
+        wrong.append('title')
+    return wrong
+
+
+def check_library(adapter: FixtureAdapter, target_dir: str,
+                  info_file: str) -> int:
+    # 逐个读取目标文件夹中的info文件并与页面模板数据比较, 返回检查的数量
+    checked, errors = 0, list()
+    for dirpath, _, filenames in os.walk(target_dir):
+        if info_file not in filenames:
+            continue
+        info = load_info(os.path.join(dirpath, info_file))
+        wrong = check_info(info, adapter.movie(info['codename']))  # type: ignore
+        if wrong:
+            errors.append(f'{dirpath}: {", ".join(wrong)}')
+        checked += 1
+    if errors:
+        raise AssertionError(f'{len(errors)} 个info文件与页面不一致:\n' +
+                             '\n'.join(errors[:10]))
+    return checked
+
+
+def bench_e2e(count: int = 10000,
+              workers: int = 8,
+              latency: float = 0.0,
+              repeat: int = 1,
+              debug: bool = True,
+              memory: bool = False,
+              keep: bool = False,
+              mode: str = 'sequential',
+              processes: int = 1,
+              shard_by: str = 'subtree',
+              harvest: int = 0,
+              refresh: bool = False,
+              conditional: bool = True):
+    # 离线端到端测试: 扫描 -> 提取番号 -> 查询(本地页面) -> 移动;
+    # refresh: 第二轮起忽略已有缓存重新获取, 用于比较条件请求的效果
+    root = tempfile.mkdtemp(prefix='gavdener-bench-')
+    src, dst = os.path.join(root, 'media'), os.path.join(root, 'library')
+    start = time.perf_counter()
+    make_media_tree(src, count)
+    print(f'生成测试目录: {root}, {count} 个文件, '
+          f'{time.perf_counter() - start:.2f}s')
+
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                           'config.yaml'),
+              'r',
+              encoding='utf-8') as fp:
+        config = yaml.safe_load(fp)
+    config['general'].update(debug=debug, media_dir=src, target_dir=dst)
+    config['spider'].pop('proxy', None)
+    config['spider'].update(workers=workers,
+                            sites=dict(),
+                            resolve_mode=mode,
+                            harvest_pages=harvest)
+    config['cache'].update(path=os.path.join(root, 'cache.db'),
+                           conditional=conditional)
+    config['log'].update(path=os.path.join(root, 'gavdener.log'),
+                         json_path=os.path.join(root, 'gavdener.jsonl'))
+    config['journal'].update(path=os.path.join(root, 'journal.jsonl'))
+    config_path = os.path.join(root, 'config.yaml')
+    with open(config_path, 'w', encoding='utf-8') as fp:
+        yaml.safe_dump(config, fp, allow_unicode=True)
+
+    adapter = FixtureAdapter(latency=latency)
+    spiders.Spider.transport = adapter
+    try:
+        for i in range(repeat):
+            core._spiders.clear()
+            adapter.requests = adapter.sent = 0
+            if memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                core.main(src,
+                          config_path,
+                          show_stats=False,
+                          refresh_cache=refresh and i > 0,
+                          processes=processes,
+                          shard_by=shard_by)
+            elapsed = time.perf_counter() - start
+            print(f'\n第{i + 1}轮: {elapsed:.2f}s, {count / elapsed:.1f} 文件/s, '
+                  f'请求 {adapter.requests} 次, '
+                  f'传输 {adapter.sent / 1024 / 1024:.1f}MiB')
+            checked = check_library(adapter, dst, config['general']['info_file'])
+            print(f'info文件校验通过: {checked} 个')
+            if memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f'内存峰值: {peak / 1024 / 1024:.1f}MiB')
+            print(stats.summary())
+    finally:
+        spiders.Spider.transport = None
+        core._spiders.clear()
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def fixture_response(html: str) -> Response:
+    # 与站点返回一致: Content-Type 未声明编码
+    response = Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'text/html'
+    response._content = html.encode('utf-8')
+    return response
+
+
+def legacy_decode(response: Response) -> str:
+    # 旧实现, 作为对照: 每个页面都进行编码探测
+    response.encoding = response.apparent_encoding
+    return response.text
+
+
+def legacy_javbus(code: str, search: str, detail: str) -> dict:
+    # 旧实现, 作为对照: 整页解析, 每次查询都从文档根节点编译执行XPath
+    tree = etree.HTML(search)
+    codes = [
+        i.text for i in tree.xpath(
+            '//*[@id="waterfall"]/div[*]/a/div[2]/span/date[1]')
+    ]
+    codename = difflib_most_like(code, codes)
+    tree = etree.HTML(detail)
+    title = re.sub(f'{codename}\\s', '',
+                   tree.xpath('/html/body/div[5]/h3')[0].text)
+    try:
+        director = tree.xpath(
+            '/html/body/div[5]/div[1]/div[2]/p[*]/span[contains(text(), "導演")]/following::a'
+        )[0].text
+    except IndexError:
+        director = spiders.MovieInfo.default_text
+    actors = [
+        actor.text
+        for actor in tree.xpath('/html/body/div[5]/div[1]/div[2]/p[*]/span/a')
+    ]
+    tags = [
+        tag.text for tag in tree.xpath(
+            '/html/body/div[5]/div[1]/div[2]/p[*]/span/label/a')
+    ]
+    return dict(codename=codename,
+                title=title,
+                director=director,
+                actors=actors,
+                tags=tags)
+
+
+def legacy_javdb(code: str, search: str, detail: str) -> dict:
+    # 旧实现, 作为对照
+    tree = etree.HTML(search)
+    code_url = {
+        node.xpath('a/div[2]/strong')[0].text: node.xpath('a')[0].attrib['href']
+        for node in tree.xpath('/html/body/section/div/div[6]/div')
+    }
+    codename = difflib_most_like(code, list(code_url))
+    tree = etree.HTML(detail)
+    panel = '/html/body/section/div/div[4]/div[1]/div/div[2]/nav/div'
+    title = tree.xpath('/html/body/section/div/div[4]/h2/strong[2]')[0].text
+    try:
+        director = tree.xpath(
+            f'{panel}/strong[contains(text(), "導演")]/following-sibling::span/a'
+        )[0].text
+    except IndexError:
+        director = spiders.MovieInfo.default_text
+    try:
+        actor_nodes = tree.xpath(f'{panel}/strong[contains(text(), "演員")]'
+                                 )[0].xpath('following-sibling::span/a')
+        actors = [
+            actor.text for actor in actor_nodes if 'female' in actor.xpath(
+                'following-sibling::strong')[0].attrib["class"]
+        ]
+    except IndexError:
+        actors = list()
+    try:
+        tags = [
+            tag.text for tag in tree.xpath(
+                f'{panel}/strong[contains(text(), "類別")]')[0].xpath(
+                    'following-sibling::span/a')
+        ]
+    except IndexError:
+        tags = list()
+    return dict(codename=codename,
+                title=title,
+                director=director,
+                actors=actors,
+                tags=tags)
+
+
+def bench_parse(count: int = 2000):
+    # 详情页/搜索页的解析与字段提取, 页面已在内存中, 不涉及网络
+    adapter = FixtureAdapter()
+    extractor = CodenameExtractor()
+    codes = [
+        extractor.match(name).upper()  # type: ignore
+        for name in fake_filenames(count)
+    ]
+    for spider_cls in (spiders.Javbus, spiders.Javdb):
+        spider = spider_cls()
+        # 页面均已预置, 万一未命中也只会访问本地模板而不会联网
+        spider.session.mount(spider.baseurl, adapter)
+        site = spider.site
+        pages = list()
+        for code in codes:
+            if site == 'javbus':
+                search = adapter.javbus(f'/search/{code}')
+                detail = adapter.javbus(f'/{code}')
+            else:
+                search = adapter.javdb('/search', f'q={code}')
+                detail = adapter.javdb(f'/v/{code}', '')
+            pages.append((code, search, detail))
+
+        responses = [(fixture_response(search), fixture_response(detail))
+                     for _, search, detail in pages]
+
+        # 旧实现: 编码探测与解析提取分别计时
+        start = time.perf_counter()
+        for search, detail in responses:
+            legacy_decode(search)
+            legacy_decode(detail)
+        old_decode = time.perf_counter() - start
+        legacy = legacy_javbus if site == 'javbus' else legacy_javdb
+        start, results = time.perf_counter(), list()
+        for code, search, detail in pages:
+            results.append((code, legacy(code, search, detail)))
+        old_extract = time.perf_counter() - start
+        for code, result in results:
+            wrong = check_info(result, adapter.movie(code))
+            assert not wrong, f'{site} {code} 旧实现字段不一致: {", ".join(wrong)}'
+
+        start = time.perf_counter()
+        for search, detail in responses:
+            spider.decode(search)
+            spider.decode(detail)
+        decode = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _, search, detail in pages:
+            etree.HTML(search)
+            etree.HTML(detail)
+        full = time.perf_counter() - start
+
+        start, infos = time.perf_counter(), list()
+        for code, search, detail in pages:
+            spider.pages.clear()
+            query = quote(code, encoding='utf-8')
+            if site == 'javbus':
+                spider.pages[f'{spider.baseurl}/search/{query}'] = search
+                spider.pages[f'https://www.javbus.com/{query}'] = detail
+            else:
+                spider.pages[f'{spider.baseurl}/search?q={query}'] = search
+                spider.pages[f'{spider.baseurl}/v/{query}'] = detail
+            spider.infos.clear()
+            infos.append((code, spider.get_info(code)))
+        extract = time.perf_counter() - start
+        # 校验不计入耗时
+        for code, info in infos:
+            assert info is not None, f'{site} 未能解析: {code}'
+            wrong = check_info(info.to_dict(), adapter.movie(code))
+            assert not wrong, f'{site} {code} 字段不一致: {", ".join(wrong)}'
+
+        print(f'{site} {count} 组页面(搜索页+详情页):')
+        print(f'  旧实现 解码(apparent_encoding): {old_decode / count * 1e6:.1f}us/组')
+        print(f'  旧实现 解析并提取字段(根路径XPath): '
+              f'{old_extract / count * 1e6:.1f}us/组')
+        print(f'  解码(按声明编码): {decode / count * 1e6:.1f}us/组')
+        print(f'  整页解析(etree.HTML): {full / count * 1e6:.1f}us/组')
+        print(f'  解析并提取字段(get_info): {extract / count * 1e6:.1f}us/组')
+
+
+def bench_codename(count: int = 100000, batch: int = 50):
+    names = fake_filenames(count)
+    extractor = CodenameExtractor()
+    filedir = '/nonexistent/media/dir'
+
+    start = time.perf_counter()
+    for name in names:
+        extractor.extract(f'{filedir}/{name}')
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, count, batch):
+        extractor.extract_batch(filedir, names[i:i + batch])
+    batched = time.perf_counter() - start
+
+    print(f'番号提取 {count} 个文件:')
+    print(f'  逐个提取: {single:.2f}s, {single / count * 1e6:.1f}us/文件')
+    print(f'  批量提取: {batched:.2f}s, {batched / count * 1e6:.1f}us/文件')
+
+
+def difflib_most_like(text: str, possibilities: list) -> str | None:
+    # 旧实现, 作为对照
+    cmp_text = text.casefold()
+    cmp_list = list(map(str.casefold, possibilities))
+    result = get_close_matches(cmp_text, cmp_list, n=3, cutoff=0.4)
+    if result:
+        return possibilities[cmp_list.index(result[0])]
+    return None
+
+
+def bench_match(count: int = 2000, candidates: int = 200, seed: int = 0):
+    # 在候选列表中查找番号: 查询文本为候选的各种写法变体;
+    # 另有两成为相邻编号等不在候选中的番号, 应返回 None
+    rnd = random.Random(seed)
+    codes = set()
+    while len(codes) < candidates:
+        if rnd.random() < 0.8:
+            codes.add(f'{rnd.choice(PREFIXES)}-{rnd.randint(1, 999):03d}')
+        else:
+            codes.add(f'FC2-PPV-{rnd.randint(1000000, 3999999)}')
+    pool = sorted(codes)
+    variants = [
+        lambda code: code.lower(),
+        lambda code: code.replace('-', '_'),
+        lambda code: code.replace('-', ''),
+        lambda code: code.replace('-', '00', 1) if not code.startswith('FC2')
+        else code.replace('-PPV-', 'ppv'),
+        lambda code: f'{rnd.choice(SITES)}{code}',
+    ]
+
+    # 相邻编号, 且没有任何候选使用该编号(前缀拼写差异仍视为同一影片)
+    numbers = {code.rsplit('-', 1)[1].lstrip('0') for code in codes}
+
+    def near_miss(code: str) -> str:
+        head, number = code.rsplit('-', 1)
+        while True:
+            number = str(int(number) + rnd.choice((-1, 1, 10))).zfill(
+                len(number))
+            if number.lstrip('0') not in numbers:
+                return f'{head}-{number}'
+
+    queries = list()
+    for _ in range(count):
+        code = rnd.choice(pool)
+        if rnd.random() < 0.2:
+            queries.append((near_miss(code), None))
+        else:
+            queries.append((rnd.choice(variants)(code), code))
+    misses = sum(expected is None for _, expected in queries)
+
+    for name, func in (('difflib', difflib_most_like),
+                       ('matcher', lambda text, possibilities:
+                        CodenameMatcher(possibilities).match(text))):
+        start, correct, wrong = time.perf_counter(), 0, 0
+        for text, expected in queries:
+            result = func(text, pool)
+            correct += result == expected
+            wrong += expected is None and result is not None
+        elapsed = time.perf_counter() - start
+        print(f'{name}: {count} 次查询, 候选 {candidates} 个, '
+              f'{elapsed / count * 1e6:.1f}us/次, 准确率 {correct / count:.1%}, '
+              f'误匹配 {wrong}/{misses}')
+
+
+def bench_info(count: int = 2000, seed: int = 0):
+    # info文件读写: 纯Python yaml / libyaml / libyaml+JSON副本;
+    # 每部影片写入主演员目录和两个其他演员目录
+    rnd = random.Random(seed)
+    infos = [
+        spiders.MovieInfo(codename=f'{rnd.choice(PREFIXES)}-{i:05d}',
+                          title=f'{rnd.choice(TAGS)} 測試標題 {i} ' * 3,
+                          director=f'監督{rnd.randint(1, 50)}',
+                          actors=rnd.sample(ACTORS, 3),
+                          tags=rnd.sample(TAGS, 4)) for i in range(count)
+    ]
+    root = tempfile.mkdtemp(prefix='gavdener-info-')
+    setup_log(path=os.path.join(root, 'gavdener.log'))
+    dirs = list()
+    for i in range(count):
+        group = [os.path.join(root, str(i), str(j)) for j in range(3)]
+        for dirpath in group:
+            os.makedirs(dirpath)
+        dirs.append(group)
+    info_file = 'gavdener-info.yml'
+
+    def legacy_mark(dirpath: str, info: spiders.MovieInfo):
+        with open(os.path.join(dirpath, info_file), 'w',
+                  encoding='utf-8') as fp:
+            fp.write(
+                yaml.dump(info.to_dict(),
+                          indent=2,
+                          allow_unicode=True,
+                          sort_keys=False))
+
+    def reuse_mark(sidecar: bool):
+
+        def _mark(group: List[str], info: spiders.MovieInfo):
+            payload = dump_info(info, sidecar)
+            for dirpath in group:
+                set_mark(dirpath,
+                         info,
+                         info_file=info_file,
+                         sidecar=sidecar,
+                         payload=payload)
+
+        return _mark
+
+    def legacy_read(info_path: str) -> str:
+        with open(info_path, 'r', encoding='utf-8') as fp:
+            return yaml.load(fp, Loader=yaml.Loader)['codename']
+
+    def cyaml_read(info_path: str) -> str:
+        with open(info_path, 'rb') as fp:
+            return yaml.load(fp, Loader=YamlLoader)['codename']
+
+    writers = (
+        ('yaml', lambda group, info: [legacy_mark(d, info) for d in group]),
+        ('libyaml', reuse_mark(False)),
+        ('libyaml+json', reuse_mark(True)),
+    )
+    try:
+        for name, writer in writers:
+            start = time.perf_counter()
+            for group, info in zip(dirs, infos):
+                writer(group, info)
+            elapsed = time.perf_counter() - start
+            print(f'写入 {name}: {count} 部 x 3 个目录, '
+                  f'{elapsed / count * 1e6:.1f}us/部')
+        paths = [os.path.join(group[0], info_file) for group in dirs]
+        readers = (
+            ('yaml', legacy_read),
+            ('libyaml', cyaml_read),
+            ('json副本(番号)', load_codename),
+            ('json副本(全部)', lambda path: load_info(path)['codename']),
+        )
+        for name, reader in readers:
+            start, correct = time.perf_counter(), 0
+            for path, info in zip(paths, infos):
+                correct += reader(path) == info.codename
+            elapsed = time.perf_counter() - start
+            print(f'读取 {name}: {count} 个, {elapsed / count * 1e6:.1f}us/个, '
+                  f'正确 {correct}/{count}')
+    finally:
+        close_log()
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='gavdener 性能测试')
+    parser.add_argument('target', choices=['codename', 'match', 'parse', 'info', 'e2e'], help='测试项目')
+    parser.add_argument('--count', type=int, default=10000, help='文件数量')
+    parser.add_argument('--candidates',
+                        type=int,
+                        default=200,
+                        help='番号匹配测试的候选数量')
+    parser.add_argument('--workers', type=int, default=8, help='解析线程数')
+    parser.add_argument('--latency',
+                        type=float,
+                        default=0.0,
+                        help='模拟每个请求的网络延迟(秒)')
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=1,
+                        help='重复运行次数, 第二轮起可测试缓存效果')
+    parser.add_argument('--no-debug',
+                        action='store_true',
+                        help='真正移动文件(仅限临时测试目录)')
+    parser.add_argument('--memory',
+                        action='store_true',
+                        help='统计内存峰值(tracemalloc, 会降低吞吐)')
+    parser.add_argument('--keep', action='store_true', help='保留测试目录')
+    parser.add_argument('--mode',
+                        default='sequential',
+                        choices=['sequential', 'race', 'merge'],
+                        help='多站点查询模式')
+    parser.add_argument('--processes', type=int, default=1, help='分片进程数')
+    parser.add_argument('--harvest',
+                        type=int,
+                        default=0,
+                        help='每个演员列表页最多收录的页数')
+    parser.add_argument('--refresh',
+                        action='store_true',
+                        help='第二轮起忽略已有缓存重新获取')
+    parser.add_argument('--no-conditional',
+                        action='store_true',
+                        help='不保存页面校验信息, 不发送条件请求')
+    parser.add_argument('--shard-by',
+                        default='subtree',
+                        choices=['subtree', 'hash'],
+                        help='分片方式')
+    args = parser.parse_args()
+    if args.target == 'codename':
+        bench_codename(args.count)
+    elif args.target == 'match':
+        bench_match(args.count, args.candidates)
+    elif args.target == 'parse':
+        bench_parse(args.count)
+    elif args.target == 'info':
+        bench_info(args.count)
+    elif args.target == 'e2e':
+        bench_e2e(args.count,
+                  workers=args.workers,
+                  latency=args.latency,
+                  repeat=args.repeat,
+                  debug=not args.no_debug,
+                  memory=args.memory,
+                  keep=args.keep,
+                  mode=args.mode,
+                  processes=args.processes,
+                  shard_by=args.shard_by,
+                  harvest=args.harvest,
+                  refresh=args.refresh,
+                  conditional=not args.no_conditional)
@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Dict, List, Tuple
+
+from exts import log, codename_key
+
+
+# 按 (站点, 番号) 持久化影片信息与原始页面, 跨运行共享
+class MetaCache:
+
+    def __init__(self,
+                 path: str = 'gavdener-cache.db',
+                 ttl: float = 30 * 86400,
+                 max_items: int = 100000,
+                 keep_html: bool = False,
+                 refresh: bool = False,
+                 miss_delay: float = 86400,
+                 transient_delay: float = 600,
+                 miss_delay_max: float = 30 * 86400,
+                 conditional: bool = True):
+        self.path = path
+        self.ttl = ttl
+        self.max_items = max_items
+        self.keep_html = keep_html
+        self.refresh = refresh
+        # 查询失败后的重试等待: 站点确认不存在与网络错误分别计算, 每次失败翻倍
+        self.miss_delay = miss_delay
+        self.transient_delay = transient_delay
+        self.miss_delay_max = miss_delay_max
+        # 保存页面的ETag/Last-Modified, 再次请求时由站点判断页面是否变化
+        self.conditional = conditional
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS infos ('
+                               'site TEXT NOT NULL, key TEXT NOT NULL, '
+                               'data TEXT, created REAL NOT NULL, '
+                               'PRIMARY KEY (site, key))')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS pages ('
+                               'url TEXT PRIMARY KEY, html TEXT NOT NULL, '
+                               'created REAL NOT NULL)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS misses ('
+                               'site TEXT NOT NULL, key TEXT NOT NULL, '
+                               'reason TEXT NOT NULL, '
+                               'attempts INTEGER NOT NULL, '
+                               'created REAL NOT NULL, retry_at REAL NOT NULL, '
+                               'PRIMARY KEY (site, key))')
+            # 演员/系列列表页中收录的 番号 -> 详情页地址, 可省去搜索请求
+            self._conn.execute('CREATE TABLE IF NOT EXISTS uris ('
+                               'site TEXT NOT NULL, key TEXT NOT NULL, '
+                               'codename TEXT NOT NULL, uri TEXT NOT NULL, '
+                               'created REAL NOT NULL, '
+                               'PRIMARY KEY (site, key))')
+            # 带校验信息的页面(压缩保存), 不受有效期限制, 收到304时直接复用
+            self._conn.execute('CREATE TABLE IF NOT EXISTS validators ('
+                               'url TEXT PRIMARY KEY, etag TEXT, '
+                               'modified TEXT, body BLOB NOT NULL, '
+                               'created REAL NOT NULL)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS harvests ('
+                               'site TEXT NOT NULL, link TEXT NOT NULL, '
+                               'created REAL NOT NULL, '
+                               'PRIMARY KEY (site, link))')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS infos_created ON infos (created)')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS pages_created ON pages (created)')
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def get_info(self, site: str, codename: str) -> dict | None:
+        if self.refresh:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, created FROM infos WHERE site=? AND key=?',
+                (site, codename_key(codename))).fetchone()
+        if row is None or self._expired(row[1]):
+            return None
+        return json.loads(row[0])
+
+    def set_info(self, site: str, codename: str, info: dict):
+        data = json.dumps(info, ensure_ascii=False)
+        keys = {codename_key(codename)}
+        # 同时以查询名与实际番号作为键
+        if info.get('codename'):
+            keys.add(codename_key(info['codename']))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO infos VALUES (?, ?, ?, ?)',
+                [(site, key, data, now) for key in keys])
+            self._conn.executemany('DELETE FROM misses WHERE site=? AND key=?',
+                                   [(site, key) for key in keys])
+
+    def get_uri(self, site: str, codename: str) -> Tuple[str, str] | None:
+        if self.refresh:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT codename, uri, created FROM uris '
+                'WHERE site=? AND key=?',
+                (site, codename_key(codename))).fetchone()
+        if row is None or self._expired(row[2]):
+            return None
+        return row[0], row[1]
+
+    def set_uris(self, site: str, uris: Dict[str, str]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO uris VALUES (?, ?, ?, ?, ?)',
+                [(site, codename_key(codename), codename, uri, now)
+                 for codename, uri in uris.items()])
+
+    def harvested(self, site: str, link: str) -> bool:
+        # 有效期内已收录过的列表页不再重复抓取
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT created FROM harvests WHERE site=? AND link=?',
+                (site, link)).fetchone()
+        return row is not None and not self._expired(row[0])
+
+    def set_harvested(self, site: str, link: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO harvests VALUES (?, ?, ?)',
+                (site, link, time.time()))
+
+    def get_miss(self, site: str, codename: str) -> dict | None:
+        # 仍处于等待期的失败记录, 到期后返回None以便重新查询
+        if self.refresh:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT reason, attempts, created, retry_at FROM misses '
+                'WHERE site=? AND key=?',
+                (site, codename_key(codename))).fetchone()
+        if row is None or row[3] <= time.time():
+            return None
+        return dict(reason=row[0],
+                    attempts=row[1],
+                    created=row[2],
+                    retry_at=row[3])
+
+    def set_miss(self, site: str, codename: str, reason: str):
+        # reason: not_found 站点上不存在; parse 页面无法解析; http 网络错误或站点熔断
+        key = codename_key(codename)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT attempts FROM misses WHERE site=? AND key=?',
+                (site, key)).fetchone()
+            attempts = 1 if row is None else row[0] + 1
+            base = self.transient_delay if reason == 'http' else self.miss_delay
+            delay = min(self.miss_delay_max, base * 2**(attempts - 1))
+            now = time.time()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO misses VALUES (?, ?, ?, ?, ?, ?)',
+                (site, key, reason, attempts, now, now + delay))
+
+    def get_page(self, url: str) -> str | None:
+        if self.refresh or not self.keep_html:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT html, created FROM pages WHERE url=?',
+                (url, )).fetchone()
+        if row is None or self._expired(row[1]):
+            return None
+        return row[0]
+
+    def set_page(self, url: str, html: str):
+        if not self.keep_html:
+            return
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)',
+                               (url, html, time.time()))
+
+    def get_validated(self,
+                      url: str) -> Tuple[str, str | None, str | None] | None:
+        # 返回 (页面, ETag, Last-Modified); 刷新缓存时同样使用, 由站点确认是否变化
+        if not self.conditional:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT body, etag, modified FROM validators WHERE url=?',
+                (url, )).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode('utf-8'), row[1], row[2]
+
+    def set_validated(self, url: str, html: str, etag: str | None,
+                      modified: str | None):
+        if not self.conditional or not (etag or modified):
+            return
+        body = zlib.compress(html.encode('utf-8'))
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?)',
+                (url, etag, modified, body, time.time()))
+
+    def touch_validated(self, url: str, etag: str | None,
+                        modified: str | None):
+        # 304响应中可能带有新的校验信息
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE validators SET etag=COALESCE(?, etag), '
+                'modified=COALESCE(?, modified), created=? WHERE url=?',
+                (etag, modified, time.time(), url))
+
+    def evict(self):
+        # 先清理过期条目, 再按创建时间淘汰超出容量的部分
+        with self._lock, self._conn:
+            if self.ttl > 0:
+                deadline = time.time() - self.ttl
+                self._conn.execute('DELETE FROM infos WHERE created < ?',
+                                   (deadline, ))
+                self._conn.execute('DELETE FROM pages WHERE created < ?',
+                                   (deadline, ))
+                self._conn.execute('DELETE FROM uris WHERE created < ?',
+                                   (deadline, ))
+                self._conn.execute('DELETE FROM harvests WHERE created < ?',
+                                   (deadline, ))
+            # 等待期早已结束的失败记录不再需要保留失败次数
+            self._conn.execute('DELETE FROM misses WHERE retry_at < ?',
+                               (time.time() - self.miss_delay_max, ))
+            if self.max_items > 0:
+                for table in ('infos', 'pages', 'uris', 'validators'):
+                    self._conn.execute(
+                        f'DELETE FROM {table} WHERE rowid IN ('
+                        f'SELECT rowid FROM {table} ORDER BY created DESC '
+                        f'LIMIT -1 OFFSET ?)', (self.max_items, ))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM infos')
+            self._conn.execute('DELETE FROM pages')
+            self._conn.execute('DELETE FROM misses')
+            self._conn.execute('DELETE FROM uris')
+            self._conn.execute('DELETE FROM harvests')
+            self._conn.execute('DELETE FROM validators')
+
+    def close(self):
+        try:
+            self.evict()
+        except sqlite3.Error:
+            log(f'缓存清理失败: {self.path}', 'WARNING')
+        with self._lock:
+            self._conn.close()
+
+
+# 记录已扫描的目录与文件, 再次运行时仅返回新增或变化的文件
+class ScanIndex:
+
+    def __init__(self, path: str = 'gavdener-cache.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS scan_dirs ('
+                               'path TEXT PRIMARY KEY, mtime REAL NOT NULL, '
+                               'ino INTEGER NOT NULL, ignored INTEGER NOT NULL, '
+                               'subdirs TEXT NOT NULL)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS scan_files ('
+                               'path TEXT PRIMARY KEY, dir TEXT NOT NULL, '
+                               'size INTEGER NOT NULL, mtime REAL NOT NULL, '
+                               'ino INTEGER NOT NULL, '
+                               'processed INTEGER NOT NULL DEFAULT 0)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS scan_files_dir '
+                               'ON scan_files (dir)')
+
+    def get_dir(self, path: str) -> Tuple[float, int, bool, List[str]] | None:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT mtime, ino, ignored, subdirs FROM scan_dirs '
+                'WHERE path=?', (path, )).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], bool(row[2]), json.loads(row[3])
+
+    def set_dir(self, path: str, stat: os.stat_result, ignored: bool,
+                subdirs: List[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO scan_dirs VALUES (?, ?, ?, ?, ?)',
+                (path, stat.st_mtime, stat.st_ino, int(ignored),
+                 json.dumps(subdirs, ensure_ascii=False)))
+
+    def get_files(self, dirpath: str) -> Dict[str, Tuple[int, float, int, bool]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path, size, mtime, ino, processed FROM scan_files '
+                'WHERE dir=?', (dirpath, )).fetchall()
+        return {row[0]: (row[1], row[2], row[3], bool(row[4])) for row in rows}
+
+    def set_files(
+        self, dirpath: str, files: Dict[str, os.stat_result]
+    ) -> Dict[str, Tuple[int, float, int, bool]]:
+        # 以本次列举结果为准: 变化的文件重置处理状态, 消失的文件删除记录
+        # 返回更新前的记录, 供调用方判断哪些文件是新增或变化的
+        known = self.get_files(dirpath)
+        rows = list()
+        for path, stat in files.items():
+            old = known.get(path)
+            processed = old is not None and old[3] and old[:3] == (
+                stat.st_size, stat.st_mtime, stat.st_ino)
+            rows.append((path, dirpath, stat.st_size, stat.st_mtime,
+                         stat.st_ino, int(processed)))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO scan_files VALUES (?, ?, ?, ?, ?, ?)',
+                rows)
+            self._conn.executemany(
+                'DELETE FROM scan_files WHERE path=?',
+                [(path, ) for path in known if path not in files])
+        return known
+
+    def mark_processed(self, path: str, processed: bool = True):
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE scan_files SET processed=? WHERE path=?',
+                               (int(processed), path))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM scan_dirs')
+            self._conn.execute('DELETE FROM scan_files')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# 文件内容指纹, 以 (设备, inode) 为键, 大小与修改时间不变时无需重新读取文件
+class FingerprintStore:
+
+    def __init__(self, path: str = 'gavdener-cache.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS fingerprints ('
+                               'dev INTEGER NOT NULL, ino INTEGER NOT NULL, '
+                               'size INTEGER NOT NULL, mtime REAL NOT NULL, '
+                               'sample TEXT, full TEXT, '
+                               'PRIMARY KEY (dev, ino))')
+
+    def get(self, stat: os.stat_result) -> Tuple[str | None, str | None]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime, sample, full FROM fingerprints '
+                'WHERE dev=? AND ino=?', (stat.st_dev, stat.st_ino)).fetchone()
+        if row is None or (row[0], row[1]) != (stat.st_size, stat.st_mtime):
+            return None, None
+        return row[2], row[3]
+
+    def set(self,
+            stat: os.stat_result,
+            sample: str | None = None,
+            full: str | None = None):
+        old_sample, old_full = self.get(stat)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)',
+                (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime,
+                 sample or old_sample, full or old_full))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM fingerprints')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
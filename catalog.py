@@ -0,0 +1,204 @@
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from itertools import groupby
+from typing import Dict, Iterable, List
+
+from exts import log, get_config, file_scanner, codename_key, load_info, Config
+
+
+# 已整理影片的本地目录, 按番号/演员/标签/导演建立索引, 查询时无需遍历目标文件夹
+class Catalog:
+
+    def __init__(self, path: str = 'gavdener-cache.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS movies ('
+                               'path TEXT PRIMARY KEY, key TEXT NOT NULL, '
+                               'codename TEXT NOT NULL, title TEXT, '
+                               'director TEXT, size INTEGER, ino INTEGER, '
+                               'updated REAL NOT NULL)')
+            for table in ('actors', 'tags'):
+                self._conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ('
+                                   f'name TEXT NOT NULL, path TEXT NOT NULL, '
+                                   f'PRIMARY KEY (name, path))')
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_path '
+                                   f'ON {table} (path)')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS movies_key ON movies (key)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS movies_director '
+                               'ON movies (director)')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS movies_size ON movies (size)')
+
+    def _delete(self, paths: List[str]):
+        rows = [(path, ) for path in paths]
+        for table in ('movies', 'actors', 'tags'):
+            self._conn.executemany(f'DELETE FROM {table} WHERE path=?', rows)
+
+    def _insert(self, items: Iterable[tuple]):
+        # items: (路径, 影片信息字典, stat)
+        movies, actors, tags = list(), list(), list()
+        now = time.time()
+        for path, info, stat in items:
+            codename = str(info['codename'])
+            movies.append((path, codename_key(codename), codename,
+                           info.get('title'), info.get('director'),
+                           None if stat is None else stat.st_size,
+                           None if stat is None else stat.st_ino, now))
+            actors.extend((name, path) for name in info.get('actors') or ())
+            tags.extend((name, path) for name in info.get('tags') or ())
+        self._delete([movie[0] for movie in movies])
+        self._conn.executemany(
+            'INSERT INTO movies VALUES (?, ?, ?, ?, ?, ?, ?, ?)', movies)
+        self._conn.executemany('INSERT OR IGNORE INTO actors VALUES (?, ?)',
+                               actors)
+        self._conn.executemany('INSERT OR IGNORE INTO tags VALUES (?, ?)',
+                               tags)
+
+    def add(self, paths: Iterable[str], info: dict):
+        # 同一影片的主文件与各演员目录下的链接在同一事务中写入
+        items = list()
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            items.append((path, info, stat))
+        with self._lock, self._conn:
+            self._insert(items)
+
+    def remove(self, paths: Iterable[str]):
+        with self._lock, self._conn:
+            self._delete(list(paths))
+
+    def find(self,
+             codename: str | None = None,
+             actor: str | None = None,
+             tag: str | None = None,
+             director: str | None = None) -> List[dict]:
+        sql, args = ['SELECT m.path, m.codename, m.title, m.director '
+                     'FROM movies m'], list()
+        where = list()
+        if actor is not None:
+            sql.append('JOIN actors a ON a.path = m.path')
+            where.append('a.name = ?')
+            args.append(actor)
+        if tag is not None:
+            sql.append('JOIN tags t ON t.path = m.path')
+            where.append('t.name = ?')
+            args.append(tag)
+        if codename is not None:
+            where.append('m.key = ?')
+            args.append(codename_key(codename))
+        if director is not None:
+            where.append('m.director = ?')
+            args.append(director)
+        if where:
+            sql.append('WHERE ' + ' AND '.join(where))
+        sql.append('ORDER BY m.key, m.path')
+        with self._lock:
+            rows = self._conn.execute(' '.join(sql), args).fetchall()
+        return [
+            dict(path=row[0], codename=row[1], title=row[2], director=row[3])
+            for row in rows
+        ]
+
+    def by_size(self, size: int) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute('SELECT path FROM movies WHERE size=?',
+                                      (size, )).fetchall()
+        return [row[0] for row in rows]
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        # 同一番号对应多个不同文件(硬链接视为同一文件)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT codename, path FROM movies WHERE key IN ('
+                'SELECT key FROM movies GROUP BY key '
+                'HAVING COUNT(DISTINCT ino) > 1) ORDER BY key, path').fetchall()
+        result: Dict[str, List[str]] = dict()
+        for codename, path in rows:
+            result.setdefault(codename, list()).append(path)
+        return result
+
+    def rebuild(self, target_dir: str, include: List[str], info_file: str,
+                ignore_file: str) -> int:
+        # 遍历目标文件夹, 按目录读取info文件后批量导入
+        items = list()
+        movies = file_scanner(target_dir=target_dir,
+                              include=include,
+                              ignore_file=ignore_file)
+        for filedir, group in groupby(movies, key=os.path.dirname):
+            info_path = os.path.join(filedir, info_file)
+            try:
+                info = load_info(info_path)
+                if info is None:
+                    continue
+                assert info['codename']
+            except Exception:
+                log(f'info文件有误: {info_path}', 'WARNING')
+                continue
+            for path in group:
+                items.append((path, info, os.stat(path)))
+        with self._lock, self._conn:
+            for table in ('movies', 'actors', 'tags'):
+                self._conn.execute(f'DELETE FROM {table}')
+            self._insert(items)
+        log(f'影片目录已重建: {target_dir}, 共{len(items)}个文件')
+        return len(items)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_catalog(config: Config) -> Catalog | None:
+    cache_conf = config.get('cache') or dict()
+    if not cache_conf.get('catalog', True):
+        return None
+    return Catalog(path=cache_conf.get('path', 'gavdener-cache.db'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='gavdener 影片目录')
+    parser.add_argument('command',
+                        choices=['rebuild', 'find', 'duplicates'],
+                        help='rebuild: 从目标文件夹的info文件重建; find: 查询; '
+                        'duplicates: 列出重复番号')
+    parser.add_argument('--config', help='配置文件路径')
+    parser.add_argument('--codename', help='按番号查询')
+    parser.add_argument('--actor', help='按演员查询')
+    parser.add_argument('--tag', help='按标签查询')
+    parser.add_argument('--director', help='按导演查询')
+    args = parser.parse_args()
+
+    _config = get_config() if args.config is None else get_config(
+        args.config)
+    catalog = get_catalog(_config) or Catalog(
+        (_config.get('cache') or dict()).get('path', 'gavdener-cache.db'))
+    if args.command == 'rebuild':
+        count = catalog.rebuild(_config.general.target_dir,
+                                _config.scrapper.target_exts,
+                                _config.general.info_file,
+                                _config.general.ignore_file)
+        print(f'已导入 {count} 个文件')
+    elif args.command == 'find':
+        for movie in catalog.find(codename=args.codename,
+                                  actor=args.actor,
+                                  tag=args.tag,
+                                  director=args.director):
+            print(f'{movie["codename"]}\t{movie["path"]}')
+    else:
+        for codename, paths in catalog.duplicates().items():
+            print(codename)
+            for path in paths:
+                print(f'  {path}')
+    catalog.close()
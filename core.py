@@ -1,133 +1,595 @@
 import os
+import time
 import shutil
 import traceback
 import sys
-from typing import List
-
-import yaml
+import argparse
+import zlib
+import queue
+import threading
+import multiprocessing as mp
+from itertools import chain, groupby
+from concurrent.futures import (Future, ThreadPoolExecutor, FIRST_COMPLETED,
+                                wait, as_completed)
+from typing import (TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List,
+                    Set, Tuple)
 
 import spiders
 from spiders import MovieInfo
-from exts import log, get_config, file_scanner, get_codename, Config
+from cache import MetaCache, ScanIndex, FingerprintStore
+from stats import stats
+from planner import MovePlanner, apply_plan
+from catalog import Catalog, get_catalog
+from dedup import Deduplicator
+from journal import Journal
+from exts import (log, log_event, setup_log, close_log, forward_logs,
+                  get_config, file_scanner, get_extractor, set_mark, dump_info,
+                  codename_key, Config)
 
+# 监视模块只在 --watch 时导入, 其中的 inotify 部分仅适用于 Linux
+if TYPE_CHECKING:
+    from watcher import Watcher
 
-def get_info(codename: str, config: Config) -> MovieInfo:
-    db_sites: List[spiders.Spider] = list()
-    for site in config.spider.resource_sites:
-        spider_name = str.capitalize(site).replace(" ", "")
-        db_sites.append(getattr(spiders, spider_name,
-                               spiders.Javdb)())  # type: ignore
-    info = None
-    while info is None:
-        try:
-            site = db_sites.pop(0)
-            site.set_proxies(config.spider.proxy)
-            info = site.get_info(codename)
-        except IndexError:
-            info = MovieInfo()
-        except:
-            log(f'获取信息失败, 不再尝试: {codename}', 'ERROR')
-            # info = MovieInfo()
-            # raise
+# 爬虫实例在整个运行期间复用, 保留其内存缓存
+_spiders: Dict[str, spiders.Spider] = dict()
+_spiders_lock = threading.Lock()
 
-    return info
 
+def get_cache(config: Config, refresh: bool = False) -> MetaCache | None:
+    cache_conf = config.get('cache') or dict()
+    if not cache_conf.get('enable', True):
+        return None
+    miss_conf = cache_conf.get('negative') or dict()
+    return MetaCache(path=cache_conf.get('path', 'gavdener-cache.db'),
+                     ttl=cache_conf.get('ttl', 30) * 86400,
+                     max_items=cache_conf.get('max_items', 100000),
+                     keep_html=cache_conf.get('keep_html', False),
+                     refresh=refresh,
+                     miss_delay=miss_conf.get('not_found', 86400),
+                     transient_delay=miss_conf.get('transient', 600),
+                     miss_delay_max=miss_conf.get('max', 30 * 86400),
+                     conditional=cache_conf.get('conditional', True))
 
-def set_mark(
-        path: str,
-        info: MovieInfo = None,  # type: ignore
-        ignore_file: str = 'gavdener.ignore',
-        info_file: str = 'info.yaml'):
-    if os.path.isdir(path):
-        target_dir = path
-    else:
-        target_dir = os.path.dirname(path)
-    if not os.path.isdir(target_dir):
-        log(f'停止添加标记, 目标路径未指向目录或文件: {path}', 'WARNING')
-        return 1
 
-    if info is None:
-        filename = ignore_file
-    else:
-        filename = info_file
-    target_path = os.path.join(target_dir, filename)
-    with open(target_path, "w", encoding='utf-8') as fp:
-        if info is None:
-            log(f'标记为无效路径: {target_dir}')
-        else:
-            log(f'添加标记: {target_dir}')
-            yaml_info = yaml.dump(info.to_dict(),
-                                  indent=2,
-                                  allow_unicode=True,
-                                  sort_keys=False)
-            fp.write(yaml_info)
-    return 0
+def get_journal(config: Config, resume: bool = False) -> Journal | None:
+    journal_conf = config.get('journal') or dict()
+    if not journal_conf.get('enable', True):
+        if resume:
+            log('未启用运行记录, 无法继续上次运行', 'WARNING')
+        return None
+    return Journal(path=journal_conf.get('path', 'gavdener-journal.jsonl'),
+                   resume=resume,
+                   sync_every=journal_conf.get('sync_every', 64),
+                   sync_interval=journal_conf.get('sync_interval', 1.0))
+
+
+def get_index(config: Config) -> ScanIndex | None:
+    cache_conf = config.get('cache') or dict()
+    if not cache_conf.get('scan_index', True):
+        return None
+    return ScanIndex(path=cache_conf.get('path', 'gavdener-cache.db'))
+
+
+def get_deduplicator(config: Config) -> Deduplicator | None:
+    if config.scrapper.get('duplicates', 'report') not in ('report', 'link'):
+        return None
+    cache_conf = config.get('cache') or dict()
+    if not cache_conf.get('enable', True):
+        return Deduplicator()
+    return Deduplicator(
+        FingerprintStore(path=cache_conf.get('path', 'gavdener-cache.db')))
+
 
+def get_spider(site: str,
+               config: Config,
+               cache: MetaCache = None) -> spiders.Spider:  # type: ignore
+    with _spiders_lock:
+        if site not in _spiders:
+            spider_name = str.capitalize(site).replace(" ", "")
+            spider = getattr(spiders, spider_name,
+                             spiders.Javdb)()  # type: ignore
+            spider.set_proxies(config.spider.get('proxy'))
+            spider.set_cache(cache)
+            spider.set_concurrency(config.spider.get('site_concurrency', 2))
+            site_conf = dict(timeout=config.spider.timeout,
+                             retry=config.spider.retry,
+                             harvest_pages=config.spider.get(
+                                 'harvest_pages', 0))
+            site_conf.update(config.spider.get('breaker') or dict())
+            site_conf.update((config.spider.get('sites') or dict()).get(
+                site, dict()))
+            spider.configure(site_conf)
+            _spiders[site] = spider
+        return _spiders[site]
 
-def move_movie(path: str, info: MovieInfo, config: Config) -> int:
+
+def close_spiders():
+    # 停止后台收录任务, 须在关闭缓存之前调用
+    with _spiders_lock:
+        for spider in _spiders.values():
+            spider.close()
+
+
+def is_resolved(info: MovieInfo | None) -> bool:
+    return info is not None and info.codename not in (
+        None, MovieInfo.default_text) and info.title != MovieInfo.default_text
+
+
+def site_info(site: spiders.Spider,
+              codename: str,
+              cancel: threading.Event | None = None) -> MovieInfo | None:
     try:
-        assert os.path.isfile(path)
-        target_root_dir = config.general.target_dir
-        main_actor = info.actors[0] if info.actors else info.default_text
-        other_actors = info.actors[1:] if len(info.actors) > 1 else list()
-        target_dir = os.path.join(target_root_dir, main_actor, info.codename)
-        os.makedirs(target_dir, exist_ok=True)
-
-        filename = os.path.basename(path)
-
-        target_path = os.path.join(target_dir, filename)
-        i = 0
-        # 确保没有文件会被覆盖
-        is_same = False
-        while os.path.exists(target_path):
-            log(f'文件已存在: {target_path}')
-            if os.stat(path).st_ino == os.stat(target_path).st_ino:
-                log(f'文件指向相同: {path} == {target_path}')
-                is_same = True
-                break
-            root, ext = os.path.splitext(filename)
-            i += 1
-            tmp_name = f'{root}-{i}{ext}'
-            target_path = os.path.join(target_dir, tmp_name)
-        if config.general.debug:
-            log(f'移动文件: {path} -> {target_path}', 'debug')
-            set_mark(target_path,
+        return site.get_info(codename, cancel)
+    except:
+        log(f'获取信息失败: {site.site} {codename}', 'ERROR')
+        return None
+
+
+def merge_info(infos: List[MovieInfo]) -> MovieInfo:
+    # 以资源站顺序中第一个有效结果为准, 演员与标签取并集, 缺失字段由其余站点补全
+    merged = MovieInfo(**infos[0].to_dict())
+    for info in infos[1:]:
+        if merged.director == MovieInfo.default_text:
+            merged.director = info.director
+        merged.actors = list(dict.fromkeys(merged.actors + info.actors))
+        merged.tags = list(dict.fromkeys(merged.tags + info.tags))
+    return merged
+
+
+def get_info(codename: str,
+             config: Config,
+             cache: MetaCache = None) -> MovieInfo:  # type: ignore
+    db_sites: List[spiders.Spider] = [
+        get_spider(site, config, cache)
+        for site in config.spider.resource_sites
+    ]
+    # 已熔断的站点直接跳过, 全部熔断时仍按原顺序尝试
+    db_sites = [site for site in db_sites if site.healthy] or db_sites
+    mode = config.spider.get('resolve_mode', 'sequential')
+
+    if mode == 'sequential' or len(db_sites) == 1:
+        for site in db_sites:
+            info = site_info(site, codename)
+            if is_resolved(info):
+                return info  # type: ignore
+        return MovieInfo()
+
+    cancel = threading.Event()
+    futures = {
+        site.submit(site_info, site, codename, cancel): idx
+        for idx, site in enumerate(db_sites)
+    }
+    results: Dict[int, MovieInfo] = dict()
+    try:
+        for future in as_completed(futures):
+            info = future.result()
+            if not is_resolved(info):
+                continue
+            if mode == 'race':
+                # 取最先返回的有效结果: 其余站点尚未开始的查询直接取消,
+                # 进行中的查询在下一次请求或重试等待时停止
+                return info  # type: ignore
+            results[futures[future]] = info  # type: ignore
+    finally:
+        cancel.set()
+        for future in futures:
+            future.cancel()
+    if results:
+        return merge_info([results[idx] for idx in sorted(results)])
+    return MovieInfo()
+
+
+def move_movie(path: str,
+               info: MovieInfo,
+               config: Config,
+               catalog: Catalog = None,  # type: ignore
+               deduper: Deduplicator = None) -> int:  # type: ignore
+    return 0 if move_movies([path], info, config, catalog, deduper) else 1
+
+
+def _marker(info: MovieInfo,
+            config: Config,
+            journal: Journal | None = None) -> Callable[..., None]:
+    # 每个目录只写一次标记, 且只序列化一次, 主目录与各演员目录写入相同内容;
+    # 给出源文件时按源文件记录到运行记录中
+    marked: Set[str] = set()
+    payload = list()
+
+    def _mark(path: str, source: str | None = None):
+        if journal is not None and source is not None:
+            journal.record(source, 'marked')
+        if os.path.dirname(path) not in marked:
+            marked.add(os.path.dirname(path))
+            if not payload:
+                payload.append(dump_info(info, config.general.info_sidecar))
+            set_mark(path,
                      info,
                      ignore_file=config.general.ignore_file,
-                     info_file=config.general.info_file)
+                     info_file=config.general.info_file,
+                     payload=payload[0])
+
+    return _mark
+
+
+def move_movies(paths: List[str],
+                info: MovieInfo,
+                config: Config,
+                catalog: Catalog = None,  # type: ignore
+                deduper: Deduplicator = None,  # type: ignore
+                journal: Journal = None) -> List[str]:  # type: ignore
+    # 同一番号的多个文件(分段/重复下载)一起移动到同一目标目录,
+    # 每个目录只写一次标记, 影片目录在同一事务中更新; 返回处理成功的源文件
+    target_root_dir = config.general.target_dir
+    main_actor = info.actors[0] if info.actors else info.default_text
+    other_actors = info.actors[1:] if len(info.actors) > 1 else list()
+    target_dir = os.path.join(target_root_dir, main_actor, info.codename)
+    mark = _marker(info, config, journal)
+
+    # primaries: 本组已放置的文件, 目录在整组完成后才更新, 查重时需一并比较
+    moved, placed, primaries = list(), list(), list()
+    for path in paths:
+        try:
+            assert os.path.isfile(path)
+            os.makedirs(target_dir, exist_ok=True)
+            result = _move_one(path, info, config, target_dir, other_actors,
+                               mark, catalog, deduper, journal, primaries)
+            primaries.append(result[0])
+            placed.extend(result)
+            moved.append(path)
+        except:
+            log(traceback.format_exc(), "ERROR")
+
+    # 调试模式下文件未移动, 不写入目录
+    if catalog is not None and not config.general.debug and placed:
+        with stats.timer('catalog'):
+            catalog.add(
+                [placed_path for placed_path in placed
+                 if os.path.isfile(placed_path)], info.to_dict())
+    return moved
+
+
+def _move_one(path: str,
+              info: MovieInfo,
+              config: Config,
+              target_dir: str,
+              other_actors: List[str],
+              mark: Callable[..., None],
+              catalog: Catalog | None,
+              deduper: Deduplicator | None,
+              journal: Journal | None = None,
+              group: List[str] | None = None) -> List[str]:
+    filename = os.path.basename(path)
+
+    target_path = os.path.join(target_dir, filename)
+    i = 0
+    # 确保没有文件会被覆盖
+    is_same = False
+    existing = list()
+    while os.path.exists(target_path):
+        log(f'文件已存在: {target_path}')
+        if os.stat(path).st_ino == os.stat(target_path).st_ino:
+            log(f'文件指向相同: {path} == {target_path}')
+            is_same = True
+            break
+        existing.append(target_path)
+        root, ext = os.path.splitext(filename)
+        i += 1
+        tmp_name = f'{root}-{i}{ext}'
+        target_path = os.path.join(target_dir, tmp_name)
+    if catalog is not None:
+        # 通过目录索引查询, 无需遍历目标文件夹
+        source_ino = os.stat(path).st_ino
+        for movie in catalog.find(codename=info.codename):
+            if movie['path'] != target_path and os.path.exists(
+                    movie['path']) and os.stat(
+                        movie['path']).st_ino != source_ino:
+                log(f'番号已整理过: {info.codename} {movie["path"]}', 'WARNING')
+                stats.incr('movie.duplicate')
+                break
+    duplicate = None
+    if deduper is not None and not is_same:
+        # 同名文件与目录中大小相同的文件, 依次比较抽样指纹/完整指纹
+        # 空文件不参与比较
+        size = os.path.getsize(path)
+        candidates = existing + (group or []) + (
+            [] if catalog is None or not size else catalog.by_size(size))
+        duplicate = deduper.find(path, candidates) if size else None
+        if duplicate is not None:
+            log(f'文件内容重复: {path} == {duplicate}', 'WARNING')
+            stats.incr('movie.duplicate_content')
+            if config.scrapper.get('duplicates') != 'link':
+                duplicate = None
+            elif os.stat(duplicate).st_dev != os.stat(target_dir).st_dev:
+                log(f'重复文件位于其他文件系统, 无法建立硬链接: {duplicate}', 'WARNING')
+                duplicate = None
+    # 已有相同内容的文件位于目标目录内时直接复用
+    if duplicate is not None and os.path.dirname(duplicate) == target_dir:
+        target_path = duplicate
+    # 先写入运行记录并落盘再移动, 中断后可据此找到已移走的文件
+    if journal is not None:
+        journal.record(path, 'moved', sync=True, dst=target_path)
+    if config.general.debug:
+        log(f'移动文件: {path} -> {target_path}', 'debug')
+        mark(target_path, path)
+    else:
+        log(f'移动文件: {path} -> {target_path}', 'info')
+        if is_same:
+            log(f'文件已存在, 仅补充信息: {target_path}')
+            mark(target_path, path)
+        elif duplicate is not None:
+            # 已有相同内容的文件: 目标目录外的建立硬链接, 再删除源文件
+            if target_path != duplicate:
+                with stats.timer('link'):
+                    os.link(duplicate, target_path)
+            log(f'以硬链接代替重复文件: {target_path} -> {duplicate}')
+            mark(target_path, path)
+            os.remove(path)
         else:
-            log(f'移动文件: {path} -> {target_path}', 'info')
-            if is_same:
-                log(f'文件已存在, 仅补充信息: {target_path}')
-                set_mark(target_path,
-                         info,
-                         ignore_file=config.general.ignore_file,
-                         info_file=config.general.info_file)
-            else:
-                set_mark(target_path,
-                         info,
-                         ignore_file=config.general.ignore_file,
-                         info_file=config.general.info_file)
+            mark(target_path, path)
+            with stats.timer('move.file'):
                 shutil.move(path, target_path)
 
-        # 创建链接
-        if config.scrapper.multi_actors:
-            for actor in other_actors:
-                tmp_dir = os.path.join(target_root_dir, actor, info.codename)
-                os.makedirs(tmp_dir, exist_ok=True)
-                tmp_path = os.path.join(tmp_dir, filename)
-                if os.path.isfile(
-                        target_path) and not os.path.exists(tmp_path):
-                    log(f'创建链接: {tmp_path} -> {target_path}')
-                    os.link(target_path, tmp_path)
-                set_mark(tmp_path,
-                         info,
-                         ignore_file=config.general.ignore_file,
-                         info_file=config.general.info_file)
-        return 0
+    return [target_path] + _link_actors(path, target_path, info, config,
+                                        other_actors, mark, journal)
+
+
+def _link_actors(path: str, target_path: str, info: MovieInfo, config: Config,
+                 other_actors: List[str], mark: Callable[..., None],
+                 journal: Journal | None) -> List[str]:
+    # 在其余演员目录下创建链接, 已存在的链接保持不变
+    placed = list()
+    if not config.scrapper.multi_actors:
+        return placed
+    filename = os.path.basename(path)
+    for actor in other_actors:
+        tmp_dir = os.path.join(config.general.target_dir, actor, info.codename)
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, filename)
+        if os.path.isfile(target_path) and not os.path.exists(tmp_path):
+            log(f'创建链接: {tmp_path} -> {target_path}')
+            if journal is not None:
+                journal.record(path, 'linked', sync=True, link=tmp_path)
+            with stats.timer('link'):
+                os.link(target_path, tmp_path)
+        placed.append(tmp_path)
+        mark(tmp_path)
+    return placed
+
+
+def extract(movies: Iterable[str],
+            config: Config) -> Iterator[Tuple[str, str]]:
+    # 扫描结果按目录连续产出, 同一目录的文件批量提取番号
+    extractor = get_extractor(config.general.info_file)
+    for filedir, group in groupby(movies, key=os.path.dirname):
+        paths = list(group)
+        with stats.timer('extract'):
+            codenames = extractor.extract_batch(
+                filedir, [os.path.basename(path) for path in paths])
+        for path in paths:
+            yield path, codenames[os.path.basename(path)]
+
+
+def resolve(codename: str,
+            config: Config,
+            cache: MetaCache = None):  # type: ignore
+    start = time.perf_counter()
+    try:
+        log(f'获取信息: {codename}')
+        info = get_info(codename, config, cache)
     except:
-        log(traceback.format_exc(), "ERROR")
-        return 1
+        log(f'处理失败: {codename}', 'ERROR')
+        raise
+    elapsed = time.perf_counter() - start
+    stats.add_time('resolve', elapsed)
+    return codename, info, elapsed
+
+
+def resolve_all(
+    items: Iterable[Tuple[str, str]],
+    config: Config,
+    cache: MetaCache = None  # type: ignore
+) -> Iterator[Tuple[List[str], str, MovieInfo | None, float]]:
+    # 解析阶段并发进行, 同时在途的任务数有上限, 内存占用不随影片数量增长
+    # 同一番号的文件合并为一组, 只查询一次, 结果按组产出
+    workers = config.spider.get('workers', 4)
+    pool = ThreadPoolExecutor(max_workers=workers,
+                              thread_name_prefix='resolver')
+    # 番号 -> 等待该番号查询结果的文件
+    inflight: Dict[str, List[str]] = dict()
+    pending: Dict[Future, Tuple[str, str]] = dict()
+
+    def _finished(done) -> Iterator[Tuple[List[str], str, MovieInfo | None,
+                                          float]]:
+        for future in done:
+            key, codename = pending.pop(future)
+            movies = inflight.pop(key)
+            try:
+                result = future.result()
+            except Exception:
+                # 单个番号出错不中断整批, 按未解析处理, 不标记为已处理, 下次运行重新查询
+                log(traceback.format_exc(), 'ERROR')
+                stats.incr('resolve.failed')
+                result = codename, MovieInfo(), 0.0
+            yield (movies, *result)
+
+    try:
+        for _, batch in groupby(items,
+                                key=lambda item: os.path.dirname(item[0])):
+            # 同一目录内的分段文件先合并, 再与正在查询的番号合并
+            groups: Dict[str, Tuple[str, List[str]]] = dict()
+            for movie, codename in batch:
+                if len(codename) <= 3:
+                    log(f'名称太短,已知信息不足,即将跳过: {codename}')
+                    yield [movie], codename, None, 0.0
+                    continue
+                key = codename_key(codename)
+                if key in inflight:
+                    inflight[key].append(movie)
+                    stats.incr('resolve.coalesced')
+                    continue
+                if key in groups:
+                    stats.incr('resolve.coalesced')
+                groups.setdefault(key, (codename, list()))[1].append(movie)
+            for key, (codename, movies) in groups.items():
+                inflight[key] = movies
+                pending[pool.submit(resolve, codename, config,
+                                    cache)] = key, codename
+                if len(pending) >= workers * 4:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from _finished(done)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from _finished(done)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def mark_processed(index: ScanIndex | None, movie: str, config: Config):
+    # 调试模式下文件未真正移动, 保留待处理状态以便正式运行
+    if index is not None and not config.general.debug:
+        index.mark_processed(movie)
+
+
+def shard_roots(src_dir: str, count: int,
+                shard_by: str) -> List[List[Tuple[str, bool]]]:
+    # 返回每个进程需要扫描的 (目录, 是否递归) 列表
+    src_dir = os.path.realpath(src_dir)
+    if shard_by == 'hash':
+        # 按路径哈希分片: 各进程都遍历整棵目录树, 只处理属于自己的文件
+        return [[(src_dir, True)] for _ in range(count)]
+    # 按顶层子目录分片: 子目录轮流分配, 顶层散落的文件由第一个进程处理
+    shards: List[List[Tuple[str, bool]]] = [list() for _ in range(count)]
+    shards[0].append((src_dir, False))
+    with os.scandir(src_dir) as entries:
+        subdirs = sorted(entry.path for entry in entries
+                         if entry.is_dir(follow_symlinks=False))
+    for i, subdir in enumerate(subdirs):
+        shards[i % count].append((subdir, True))
+    return shards
+
+
+def shard_worker(idx: int, count: int, roots: List[Tuple[str, bool]],
+                 hashed: bool, config_path: str | None, use_cache: bool,
+                 refresh_cache: bool, results, log_queue, stop):
+    # 子进程: 负责分片内的扫描/提取番号/解析信息, 结果交由主进程移动文件
+    # fork 得到的线程池与会话不可复用, 在子进程内重新创建
+    _spiders.clear()
+    _config = get_config() if config_path is None else get_config(
+        config_path)
+    setup_log(**(_config.get('log') or dict()), forward=log_queue)
+    stats.reset()
+    cache = get_cache(_config, refresh_cache) if use_cache else None
+    index = get_index(_config)
+    scanned = 0
+
+    def _movies() -> Iterator[str]:
+        nonlocal scanned
+        for root, recursive in roots:
+            for movie in file_scanner(target_dir=root,
+                                      include=_config.scrapper.target_exts,
+                                      ignore_file=_config.general.ignore_file,
+                                      index=index,
+                                      recursive=recursive):
+                if hashed and zlib.crc32(movie.encode('utf-8')) % count != idx:
+                    continue
+                scanned += 1
+                yield movie
+
+    try:
+        for movies, codename, info, resolve_time in resolve_all(
+                extract(stats.timed_iter('scan', _movies()), _config),
+                _config, cache):
+            if stop.is_set():
+                break
+            results.put(('movie', idx, scanned, movies, codename,
+                         None if info is None else info.to_dict(),
+                         resolve_time))
+    except Exception:
+        log(f'分片进程异常退出: {idx}\n{traceback.format_exc()}', 'ERROR')
+    finally:
+        close_spiders()
+        results.put(('done', idx, scanned, stats.dump()))
+        if cache is not None:
+            cache.close()
+        if index is not None:
+            index.close()
+        close_log()
+
+
+def resolve_sharded(
+    src_dir: str,
+    config_path: str | None,
+    config: Config,
+    processes: int,
+    shard_by: str,
+    progress: 'Progress',
+    use_cache: bool = True,
+    refresh_cache: bool = False
+) -> Iterator[Tuple[List[str], str, MovieInfo | None, float]]:
+    ctx = mp.get_context()
+    results, log_queue, stop = ctx.Queue(), ctx.Queue(), ctx.Event()
+    shards = shard_roots(src_dir, processes, shard_by)
+    # 先关闭日志, 避免子进程继承尚未写入的日志缓冲
+    close_log()
+    workers = [
+        ctx.Process(target=shard_worker,
+                    args=(idx, processes, roots, shard_by == 'hash',
+                          config_path, use_cache, refresh_cache, results,
+                          log_queue, stop),
+                    name=f'shard-{idx}',
+                    daemon=True) for idx, roots in enumerate(shards)
+    ]
+    for worker in workers:
+        worker.start()
+    setup_log(**(config.get('log') or dict()))
+    listener = forward_logs(log_queue)
+    log(f'已启动{processes}个分片进程, 分片方式: {shard_by}')
+
+    scanned = [0] * processes
+    running = set(range(processes))
+    try:
+        while running:
+            try:
+                message = results.get(timeout=1)
+            except queue.Empty:
+                # 子进程意外终止时不再等待其结果
+                running -= {
+                    idx
+                    for idx in running if not workers[idx].is_alive()
+                }
+                continue
+            kind, idx, scanned[idx] = message[:3]
+            progress.scanned = sum(scanned)
+            if kind == 'done':
+                running.discard(idx)
+                stats.merge(message[3])
+                continue
+            movies, codename, info, resolve_time = message[3:]
+            yield movies, codename, None if info is None else MovieInfo(
+                **info), resolve_time
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                log(f'分片进程未能正常退出, 强制结束: {worker.name}', 'WARNING')
+                worker.terminate()
+        listener.stop()
+
+
+class Progress:
+
+    def __init__(self):
+        self.scanned = 0
+        self.done = 0
+
+    def track(self, items: Iterable[str]) -> Iterator[str]:
+        for item in items:
+            self.scanned += 1
+            yield item
+
+    def __str__(self):
+        return f'{self.done}/{self.scanned}'
 
 
 def bar(msg):
@@ -135,7 +597,201 @@ def bar(msg):
     sys.stdout.flush()
 
 
-def main(src_dir: str = None, config: str = None) -> int:  # type: ignore
+def organize(results: Iterable[Tuple[List[str], str, MovieInfo | None,
+                                      float]],
+             progress: Progress,
+             config: Config,
+             planner: MovePlanner | None = None,
+             index: ScanIndex | None = None,
+             catalog: Catalog | None = None,
+             deduper: Deduplicator | None = None,
+             journal: Journal | None = None):
+    # 扫描 -> 提取番号 -> 解析信息 -> 移动文件, 各阶段流式衔接
+    # 文件移动阶段在主线程(多进程模式下为主进程)中串行执行, 同一番号的文件成组移动
+    # 出错的文件记为失败并继续处理其余影片
+    for movies, codename, info, resolve_time in results:
+        progress.done += len(movies)
+        bar(f'正在处理: {movies[0]} 进度: {progress}')
+        if info is None:
+            for movie in movies:
+                mark_processed(index, movie, config)
+                stats.incr('movie.skipped')
+                log_event('movie',
+                          path=movie,
+                          codename=codename,
+                          status='skipped')
+                if journal is not None:
+                    journal.record(movie, 'done', status='skipped')
+            continue
+        log(f"开始处理: {', '.join(movies)}".rjust(128, ">"))
+        start, statuses = time.perf_counter(), dict.fromkeys(movies, 'failed')
+        try:
+            log(f"影片信息:\n{info}")
+            if journal is not None:
+                for movie in movies:
+                    journal.record(movie,
+                                   'resolved',
+                                   codename=codename,
+                                   info=info.to_dict())
+            if planner is not None:
+                # 仅生成计划, 文件保持原样, 也不更新扫描索引
+                if is_resolved(info):
+                    for movie in movies:
+                        planner.add(movie, info)
+                        statuses[movie] = 'planned'
+                else:
+                    statuses = dict.fromkeys(movies, 'unresolved')
+            elif is_resolved(info):
+                for movie in move_movies(movies, info, config, catalog,
+                                         deduper, journal):
+                    mark_processed(index, movie, config)
+                    statuses[movie] = 'moved'
+            else:
+                # 不再写入忽略标记, 以免同目录的其他影片被跳过;
+                # 保持未处理状态, 由失败记录决定何时重新查询
+                statuses = dict.fromkeys(movies, 'unresolved')
+        except Exception:
+            log(f'处理失败: {", ".join(movies)}', 'ERROR')
+            log(traceback.format_exc(), 'ERROR')
+        finally:
+            log(f"处理结束: {', '.join(movies)}".rjust(128, "<"))
+            move_time = time.perf_counter() - start
+            stats.add_time('move', move_time)
+            for movie, status in statuses.items():
+                stats.incr(f'movie.{status}')
+                log_event('movie',
+                          path=movie,
+                          codename=info.codename,
+                          status=status,
+                          group=len(movies),
+                          resolve=round(resolve_time, 4),
+                          move=round(move_time, 4))
+                if journal is not None:
+                    journal.record(movie, 'done', status=status)
+
+
+def resume_journal(
+    journal: Journal,
+    config: Config,
+    catalog: Catalog | None = None,
+    index: ScanIndex | None = None
+) -> Iterator[Tuple[List[str], str, MovieInfo | None, float]]:
+    # 上次运行中已解析但未完成的文件: 源文件仍在的直接按记录的信息整理,
+    # 已移动的补全其余演员目录下的链接, 均不再查询
+    groups: Dict[str, Tuple[MovieInfo, List[str]]] = dict()
+    for path in journal.unfinished():
+        entry = journal.entries[path]
+        info = MovieInfo(**entry['info'])
+        if os.path.isfile(path):
+            groups.setdefault(codename_key(info.codename),
+                              (info, list()))[1].append(path)
+            continue
+        main_actor = info.actors[0] if info.actors else info.default_text
+        target_path = entry.get('dst') or os.path.join(
+            config.general.target_dir, main_actor, info.codename,
+            os.path.basename(path))
+        status = 'failed'
+        try:
+            if os.path.isfile(target_path):
+                log(f'补全上次未完成的整理: {path} -> {target_path}')
+                placed = [target_path] + _link_actors(
+                    path, target_path, info, config, info.actors[1:],
+                    _marker(info, config, journal), journal)
+                if catalog is not None and not config.general.debug:
+                    catalog.add([item for item in placed if os.path.isfile(item)],
+                                info.to_dict())
+                mark_processed(index, path, config)
+                status = 'moved'
+            else:
+                log(f'文件已不存在, 跳过: {path}', 'WARNING')
+        except Exception:
+            log(traceback.format_exc(), 'ERROR')
+        stats.incr(f'movie.{status}')
+        journal.record(path, 'done', status=status)
+    for info, movies in groups.values():
+        yield movies, info.codename, info, 0.0
+
+
+def skip_journaled(
+    results: Iterable[Tuple[List[str], str, MovieInfo | None, float]],
+    journal: Journal
+) -> Iterator[Tuple[List[str], str, MovieInfo | None, float]]:
+    # 多进程模式下由子进程扫描, 在主进程中剔除上次运行已处理的文件
+    for movies, codename, info, elapsed in results:
+        movies = [
+            movie for movie in movies
+            if journal.state(movie) in (None, 'scanned')
+        ]
+        if movies:
+            yield movies, codename, info, elapsed
+
+
+def source_watcher(src_dir: str, config: Config) -> 'Watcher':
+    from watcher import get_watcher
+    watch_conf = config.get('watch') or dict()
+    src_dir = os.path.realpath(src_dir)
+    target_dir = os.path.realpath(config.general.target_dir)
+    # 目标文件夹与源文件夹相同时, 跳过已整理(带有info文件)的目录
+    marks = (config.general.ignore_file, ) if target_dir != src_dir else (
+        config.general.ignore_file, config.general.info_file)
+    exclude = (target_dir, ) if target_dir.startswith(
+        os.path.join(src_dir, '')) else ()
+    return get_watcher(src_dir,
+                       config.scrapper.target_exts,
+                       marks=marks,
+                       exclude=exclude,
+                       interval=watch_conf.get('interval', 5),
+                       polling=watch_conf.get('polling', False))
+
+
+def watch_loop(watcher: 'Watcher',
+               config: Config,
+               progress: Progress,
+               cache: MetaCache | None = None,
+               index: ScanIndex | None = None,
+               catalog: Catalog | None = None,
+               deduper: Deduplicator | None = None,
+               journal: Journal | None = None):
+    # 常驻运行: 只处理新增且已写入完成的文件, 爬虫会话与缓存在事件之间保持
+    from watcher import Debouncer
+    debouncer = Debouncer(
+        settle=(config.get('watch') or dict()).get('settle', 30))
+    log(f'开始监视: {watcher.root}')
+    try:
+        while True:
+            for path in watcher.poll(timeout=1):
+                debouncer.add(path)
+            movies = debouncer.ready()
+            if not movies:
+                continue
+            log(f'发现新文件{len(movies)}个')
+            try:
+                organize(
+                    resolve_all(extract(progress.track(movies), config),
+                                config, cache), progress, config, None, index,
+                    catalog, deduper, journal)
+            except Exception:
+                log(traceback.format_exc(), 'ERROR')
+            log_event('watch', done=progress.done, pending=len(debouncer))
+    except KeyboardInterrupt:
+        log('停止监视')
+    finally:
+        watcher.close()
+
+
+def main(src_dir: str = None,  # type: ignore
+         config: str = None,  # type: ignore
+         use_cache: bool = True,
+         refresh_cache: bool = False,
+         full_scan: bool = False,
+         show_stats: bool = True,
+         report: str = None,  # type: ignore
+         plan: str = None,  # type: ignore
+         apply: str = None,  # type: ignore
+         processes: int = 1,
+         shard_by: str = 'subtree',
+         watch: bool = False,
+         resume: bool = False) -> int:
     if config is None:
         _config = get_config()
     else:
@@ -144,40 +800,122 @@ def main(src_dir: str = None, config: str = None) -> int:  # type: ignore
     if src_dir is None:
         src_dir = _config.general.media_dir
 
-    all_movies = file_scanner(target_dir=src_dir,
-                              include=_config.scrapper.target_exts,
-                              ignore_file=_config.general.ignore_file)
-    total = len(all_movies)
-    log(f'共扫描到影片{total}部')
-
-    for movie in all_movies:
-        bar(f'正在处理: {movie} 进度: {all_movies.index(movie)+1}/{total}')
-        log(f"开始处理: {movie}".rjust(128, ">"))
-        codename = get_codename(movie, _config.general.info_file)
-        if len(codename) <= 3:
-            f'名称太短,已知信息不足,即将跳过: {codename}'
-            continue
-        try:
-            log(f'获取信息: {codename}')
-            info = get_info(codename, _config)
-            log(f"影片信息:\n{info}")
-            if info.codename and info.codename != MovieInfo.default_text:
-                move_movie(movie, info, _config)
-            else:
-                set_mark(movie,
+    setup_log(**(_config.get('log') or dict()))
+    stats.reset()
+    if apply is not None:
+        catalog = get_catalog(_config)
+        failed = apply_plan(apply, _config, catalog=catalog)
+        if catalog is not None:
+            catalog.close()
+        close_log()
+        return 1 if failed else 0
+    planner = MovePlanner(_config) if plan is not None else None
+    cache = get_cache(_config, refresh_cache) if use_cache else None
+    index = get_index(_config)
+    catalog = get_catalog(_config) if plan is None else None
+    deduper = get_deduplicator(_config) if plan is None else None
+    if index is not None and full_scan:
+        index.clear()
+    # 仅生成计划时不移动文件, 无需记录
+    journal = get_journal(_config, resume) if plan is None else None
+
+    # 先开始监视再进行首次整理, 期间新增的文件不会遗漏
+    watcher = source_watcher(src_dir, _config) if watch and (
+        planner is None) else None
+    progress = Progress()
+    if processes > 1:
+        results = resolve_sharded(src_dir, config, _config, processes,
+                                  shard_by, progress, use_cache,
+                                  refresh_cache)
+        if journal is not None and resume:
+            results = skip_journaled(results, journal)
+    else:
+        scanned = stats.timed_iter(
+            'scan',
+            file_scanner(target_dir=src_dir,
+                         include=_config.scrapper.target_exts,
                          ignore_file=_config.general.ignore_file,
-                         info_file=_config.general.info_file)
-        except:
-            log(f'处理失败: {movie}', 'ERROR')
-            # log(traceback.format_exc(), 'ERROR')
-            raise
-        finally:
-            log(f"处理结束: {movie}".rjust(128, "<"))
+                         index=index))
+        all_movies = progress.track(
+            scanned if journal is None else journal.track(scanned))
+        results = resolve_all(extract(all_movies, _config), _config, cache)
+    if journal is not None and resume:
+        results = chain(resume_journal(journal, _config, catalog, index),
+                        results)
+
+    try:
+        organize(results, progress, _config, planner, index, catalog, deduper,
+                 journal)
+        if watcher is not None:
+            watch_loop(watcher, _config, progress, cache, index, catalog,
+                       deduper, journal)
+        log(f'共扫描到影片{progress.scanned}部')
+        log_event('run', scanned=progress.scanned, done=progress.done)
+        if planner is not None:
+            planner.write(plan)
+        summary = stats.summary()
+        log(f'运行统计:\n{summary}')
+        if show_stats:
+            print(f'\n{summary}')
+        if report is not None:
+            stats.export(report)
+    finally:
+        # 中断或出错时也写入已缓冲的记录, 并停止后台收录, 否则退出时会等待其全部完成
+        if journal is not None:
+            journal.close()
+        close_spiders()
+        if cache is not None:
+            cache.close()
+        if index is not None:
+            index.close()
+        if catalog is not None:
+            catalog.close()
+        if deduper is not None and deduper.store is not None:
+            deduper.store.close()
+    close_log()
+    return 0
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        args = sys.argv[1:]
-        main(*args)
-    else:
-        main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='gavdener 影片整理工具')
+    parser.add_argument('src_dir', nargs='?', help='源文件夹, 默认读取配置文件')
+    parser.add_argument('config', nargs='?', help='配置文件路径')
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help='不读写本地信息缓存')
+    parser.add_argument('--refresh-cache',
+                        action='store_true',
+                        help='忽略已有缓存, 重新获取并写入')
+    parser.add_argument('--full-scan',
+                        action='store_true',
+                        help='清空扫描索引, 重新扫描全部文件')
+    parser.add_argument('--report', help='将运行统计以JSON格式导出到指定文件')
+    parser.add_argument('--plan', help='仅生成整理计划并写入指定文件, 不移动文件')
+    parser.add_argument('--apply', help='执行指定的整理计划文件, 中断后可再次执行以继续')
+    parser.add_argument('--processes',
+                        type=int,
+                        default=1,
+                        help='分片进程数, 大于1时各进程并行扫描与解析, 由主进程统一移动文件')
+    parser.add_argument('--shard-by',
+                        default='subtree',
+                        choices=['subtree', 'hash'],
+                        help='分片方式: 按顶层子目录或按路径哈希')
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help='按运行记录继续上次中断的整理, 跳过已完成的文件, 复用已解析的信息')
+    parser.add_argument('--watch',
+                        action='store_true',
+                        help='整理完成后继续监视源文件夹, 自动处理新下载的影片')
+    args = parser.parse_args()
+    main(args.src_dir,
+         args.config,
+         use_cache=not args.no_cache,
+         refresh_cache=args.refresh_cache,
+         full_scan=args.full_scan,
+         report=args.report,
+         plan=args.plan,
+         apply=args.apply,
+         processes=args.processes,
+         shard_by=args.shard_by,
+         watch=args.watch,
+         resume=args.resume)
\ No newline at end of file
@@ -0,0 +1,92 @@
+import os
+import hashlib
+from typing import Iterable
+
+from cache import FingerprintStore
+from stats import stats
+from exts import log
+
+# 抽样指纹读取文件头/中/尾各一块, 完整指纹按大块顺序读取
+SAMPLE_SIZE = 1024 * 1024
+READ_SIZE = 8 * 1024 * 1024
+
+
+def sample_hash(path: str, size: int, block: int = SAMPLE_SIZE) -> str:
+    digest = hashlib.blake2b(str(size).encode(), digest_size=20)
+    with open(path, 'rb') as fp:
+        if size <= block * 3:
+            digest.update(fp.read())
+        else:
+            for offset in (0, (size - block) // 2, size - block):
+                fp.seek(offset)
+                digest.update(fp.read(block))
+    stats.add_bytes('fingerprint', min(size, block * 3))
+    return digest.hexdigest()
+
+
+def full_hash(path: str, chunk: int = READ_SIZE) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    buffer = bytearray(chunk)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as fp:
+        while True:
+            count = fp.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+            stats.add_bytes('fingerprint', count)
+    return digest.hexdigest()
+
+
+# 依次比较大小/抽样指纹/完整指纹, 只有抽样指纹相同时才读取整个文件
+class Deduplicator:
+
+    def __init__(self,
+                 store: FingerprintStore | None = None,
+                 block: int = SAMPLE_SIZE):
+        self.store = store
+        self.block = block
+
+    def fingerprint(self, path: str, full: bool = False) -> str:
+        stat = os.stat(path)
+        sample, whole = (None, None) if self.store is None else self.store.get(
+            stat)
+        if sample is None:
+            with stats.timer('fingerprint.sample'):
+                sample = sample_hash(path, stat.st_size, self.block)
+            # 小文件的抽样指纹即为完整内容
+            if stat.st_size <= self.block * 3:
+                whole = sample
+            if self.store is not None:
+                self.store.set(stat, sample, whole)
+        if not full:
+            return sample
+        if whole is None:
+            with stats.timer('fingerprint.full'):
+                whole = full_hash(path)
+            if self.store is not None:
+                self.store.set(stat, sample, whole)
+        return whole
+
+    def same_content(self, path1: str, path2: str) -> bool:
+        stat1, stat2 = os.stat(path1), os.stat(path2)
+        if (stat1.st_dev, stat1.st_ino) == (stat2.st_dev, stat2.st_ino):
+            return True
+        if stat1.st_size != stat2.st_size:
+            return False
+        if self.fingerprint(path1) != self.fingerprint(path2):
+            return False
+        return self.fingerprint(path1, True) == self.fingerprint(path2, True)
+
+    def find(self, path: str, candidates: Iterable[str]) -> str | None:
+        # 返回与 path 内容相同的第一个候选文件
+        size = os.path.getsize(path)
+        for candidate in candidates:
+            try:
+                if candidate == path or os.path.getsize(candidate) != size:
+                    continue
+                if self.same_content(path, candidate):
+                    return candidate
+            except OSError:
+                log(f'读取文件失败, 跳过指纹比较: {candidate}', 'WARNING')
+        return None
@@ -1,42 +1,288 @@
 import os
 import re
-from typing import Any, List
-from difflib import SequenceMatcher, get_close_matches
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 
 import yaml
 
+from stats import stats
+
+
+LOG_LEVELS = {
+    'd': logging.DEBUG,
+    'i': logging.INFO,
+    'w': logging.WARNING,
+    'e': logging.ERROR,
+    'c': logging.CRITICAL,
+}
+
+logger = logging.getLogger('gavdener')
+event_logger = logging.getLogger('gavdener.events')
+_log_listener: QueueListener | None = None
+
+
+class LineFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        return f'[{record.levelname[0].lower()}]::{record.getMessage()}'
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = dict(time=round(record.created, 3),
+                    level=record.levelname.lower(),
+                    event=record.getMessage())
+        data.update(getattr(record, 'fields', dict()))
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BufferedFileHandler(RotatingFileHandler):
+    # 保持文件句柄打开, 累计一定条数或遇到错误时才刷新到磁盘
+    def __init__(self, *args, flush_every: int = 64, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flush_every = flush_every
+        self._pending = 0
+        self._urgent = False
+
+    def emit(self, record: logging.LogRecord):
+        self._pending += 1
+        self._urgent = record.levelno >= logging.ERROR
+        super().emit(record)
+
+    def flush(self):
+        if self._urgent or self._pending >= self.flush_every:
+            self._pending = 0
+            self._urgent = False
+            super().flush()
+
+    def close(self):
+        self._urgent = True
+        super().close()
+
+
+def setup_log(path: str = 'gavdener.log',
+              level: str = 'debug',
+              max_bytes: int = 10 * 1024 * 1024,
+              backup_count: int = 3,
+              background: bool = True,
+              json_path: str | None = None,
+              flush_every: int = 64,
+              forward=None):
+    global _log_listener
+    close_log()
+    logger.setLevel(LOG_LEVELS.get(level[0].lower(), logging.DEBUG))
+    logger.propagate = False
+    # 结构化日志不受文本日志级别影响
+    event_logger.setLevel(logging.INFO)
+    if forward is not None:
+        # 子进程: 日志记录转发给主进程统一写入
+        logger.addHandler(QueueHandler(forward))
+        return
+
+    handlers: List[logging.Handler] = list()
+    line_handler = BufferedFileHandler(path,
+                                       maxBytes=max_bytes,
+                                       backupCount=backup_count,
+                                       encoding='utf-8',
+                                       delay=True,
+                                       flush_every=flush_every)
+    line_handler.setFormatter(LineFormatter())
+    line_handler.addFilter(lambda record: record.name != event_logger.name)
+    handlers.append(line_handler)
+    if json_path:
+        json_handler = BufferedFileHandler(json_path,
+                                           maxBytes=max_bytes,
+                                           backupCount=backup_count,
+                                           encoding='utf-8',
+                                           delay=True,
+                                           flush_every=flush_every)
+        json_handler.setFormatter(JsonFormatter())
+        json_handler.addFilter(
+            lambda record: record.name == event_logger.name)
+        handlers.append(json_handler)
+
+    if background:
+        # 由后台线程写入磁盘, 调用方只需入队
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        logger.addHandler(QueueHandler(log_queue))
+        _log_listener = QueueListener(log_queue,
+                                      *handlers,
+                                      respect_handler_level=True)
+        _log_listener.start()
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
+
+def close_log():
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+
+atexit.register(close_log)
+
+
+class _Dispatcher(logging.Handler):
+
+    def handle(self, record: logging.LogRecord):
+        logging.getLogger(record.name).handle(record)
+        return True
+
+
+def forward_logs(log_queue) -> QueueListener:
+    # 主进程: 接收子进程转发的日志记录, 交由本进程的日志处理器写入
+    listener = QueueListener(log_queue, _Dispatcher())
+    listener.start()
+    return listener
+
 
 def log(msg: str, level: str = "i"):
-    with open("gavdener.log", "a", encoding='utf-8') as fp:
-        fp.write(f'[{level[0].lower()}]::{msg}\n')
+    if not logger.handlers:
+        setup_log()
+    logger.log(LOG_LEVELS.get(level[0].lower(), logging.INFO), msg)
+
+
+def log_event(event: str, **fields):
+    # 结构化日志, 每条记录输出为一行JSON
+    if not logger.handlers:
+        setup_log()
+    event_logger.info(event, extra=dict(fields=fields))
+
+
+class ConfigError(ValueError):
+    pass
+
 
+def _freeze(value: Any, path: str) -> Any:
+    if isinstance(value, dict):
+        return Config(value, path)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item, path) for item in value)
+    return value
 
+
+# 只读的配置快照: 构造时一次性将嵌套的字典转换为Config, 列表转换为元组;
+# 属性访问直接返回已转换的值, 不再每次创建新的包装对象
 class Config(dict):
+    __slots__ = ('_path', )
 
-    def __init__(self, data: dict = dict()):
-        super().__init__(data)
+    def __init__(self, data: dict = dict(), path: str = ''):
+        super().__init__({
+            key: _freeze(value, f'{path}{key}.')
+            for key, value in data.items()
+        })
+        object.__setattr__(self, '_path', path)
 
-    def __getattribute__(self, __name: str) -> Any:
-        try:
-            attr = object.__getattribute__(self, __name)
-            return attr
-        except AttributeError:
-            res = self.get(__name)
-            if res is None:
-                raise
-            elif isinstance(res, dict):
-                return Config(res)
+    def __getattr__(self, name: str) -> Any:
+        # 仅在常规属性查找失败时调用; 值为空视同缺失
+        value = self.get(name)
+        if value is None:
+            raise AttributeError(f'配置项缺失或为空: {self._path}{name}')
+        return value
+
+    def __reduce__(self):
+        return Config, (dict(self), self._path)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f'配置为只读: {self._path.rstrip(".") or "config"}')
+
+    __setattr__ = __delattr__ = _readonly  # type: ignore
+    __setitem__ = __delitem__ = __ior__ = _readonly  # type: ignore
+    update = pop = popitem = clear = setdefault = _readonly  # type: ignore
+
+
+REQUIRED = object()
+# 载入时检查的配置项: 类型, 默认值(REQUIRED 表示必须填写)
+CONFIG_SCHEMA: Dict[str, Tuple[Any, Any]] = {
+    'general.media_dir': (str, REQUIRED),
+    'general.target_dir': (str, REQUIRED),
+    'general.debug': (bool, False),
+    'general.ignore_file': (str, 'gavdener.ignore'),
+    'general.info_file': (str, 'gavdener-info.yml'),
+    'general.info_sidecar': (bool, False),
+    'spider.resource_sites': (list, REQUIRED),
+    'spider.timeout': ((int, float), 10),
+    'spider.retry': (int, 3),
+    'scrapper.target_exts': (list, REQUIRED),
+    'scrapper.multi_actors': (bool, True),
+}
+
+
+def load_config(data: dict, source: str = 'config') -> Config:
+    # 检查必需项与类型并补全默认值, 所有错误一次性报告
+    data = dict(data or dict())
+    errors = list()
+    for key, (kind, default) in CONFIG_SCHEMA.items():
+        section, name = key.split('.')
+        values = data.get(section)
+        if values is None:
+            values = dict()
+        elif not isinstance(values, dict):
+            if f'{section} 应为字典' not in errors:
+                errors.append(f'{section} 应为字典')
+            continue
+        values = data[section] = dict(values)
+        value = values.get(name)
+        if value is None:
+            if default is REQUIRED:
+                errors.append(f'缺少 {key}')
             else:
-                return res
+                values[name] = default
+        elif not isinstance(value, kind) or (kind is int and
+                                             isinstance(value, bool)):
+            names = '/'.join(t.__name__ for t in (
+                kind if isinstance(kind, tuple) else (kind, )))
+            errors.append(f'{key} 应为 {names}, 实际为 {value!r}')
+    if errors:
+        raise ConfigError(f'配置文件有误({source}): ' + '; '.join(errors))
+    return Config(data)
+
+
+class TokenBucket:
+    # 令牌桶限速: 平均每秒rate个请求, 允许burst个突发
+    def __init__(self, rate: float = 1.0, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
 
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
-def get_config(path: str = 'config.yaml'):
+
+def get_config(path: str = 'config.yaml') -> Config:
 
     def _read_config(path):
-        with open(path, 'r', encoding='utf-8') as fp:
-            # config = yaml.Loader(fp).get_data()
-            config = Config(yaml.Loader(fp).get_data())
-        return config
+        with open(path, 'rb') as fp:
+            return load_config(yaml.load(fp, Loader=YamlLoader), path)
 
     if os.path.isfile(path):
         return _read_config(path)
@@ -53,98 +299,390 @@ def file_scanner(target_dir: str,
                  include: list = list(),
                  exclude: list = list(),
                  func=lambda x: os.path.splitext(x)[1],
-                 ignore_file: str = 'gavdener.ignore') -> List[str]:
-    result = list()
-
-    for parent_dir, dirs, files in os.walk(target_dir):
-
-        _parent_dir = os.path.relpath(parent_dir, target_dir)
-
-        if files:
-            if ignore_file in files:
-                continue
-            for file in files:
-                if include and func(file) not in include:
-                    continue
-                if exclude and func(file) in exclude:
-                    continue
-                result.append(
-                    os.path.join(os.path.realpath(target_dir), _parent_dir,
-                                 file))
-        elif dirs:
-            pass
+                 ignore_file: str = 'gavdener.ignore',
+                 index=None,
+                 recursive: bool = True) -> Iterator[str]:
+
+    def _accept(file: str) -> bool:
+        if include and func(file) not in include:
+            return False
+        if exclude and func(file) in exclude:
+            return False
+        return True
+
+    def _scan(parent_dir: str) -> Iterator[str]:
+        try:
+            stat = os.stat(parent_dir)
+        except OSError:
+            log(f'无法访问目录: {parent_dir}', 'WARNING')
+            return
+        record = index.get_dir(parent_dir) if index is not None else None
+        if record is not None and record[:2] == (stat.st_mtime, stat.st_ino):
+            # 目录自上次扫描后未变化: 不再列举, 仅返回尚未处理的文件
+            _, _, ignored, subdirs = record
+            if not ignored:
+                for path, (*_, processed) in index.get_files(
+                        parent_dir).items():
+                    if not processed:
+                        yield path
         else:
-            # result.append(os.path.join(os.path.realpath(target_dir), _parent_dir))
-            pass
-    return result
-
-
-def common_part(text1: str, text2: str, ret_id: int = -1) -> str:
-    astart, bstart, size = SequenceMatcher(a=text1,
-                                           b=text2).find_longest_match()
-    # print(part.groups())
-    if size < 5:
-        if ret_id not in (0, 1):
-            return min(text1, text2)
+            subdirs, files = list(), dict()
+            try:
+                with os.scandir(parent_dir) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file():
+                            files[entry.name] = entry
+            except OSError as e:
+                # 无权限等原因无法列举时跳过该目录, 不中断整个扫描
+                log(f'无法读取目录, 跳过: {parent_dir} ({e})', 'WARNING')
+                return
+            ignored = ignore_file in files
+            accepted = list() if ignored else [
+                entry for name, entry in files.items() if _accept(name)
+            ]
+            if index is None:
+                yield from (entry.path for entry in accepted)
+            else:
+                file_stats = dict()
+                for entry in accepted:
+                    try:
+                        file_stats[entry.path] = entry.stat()
+                    except OSError as e:
+                        # 扫描期间被删除或移走的文件
+                        log(f'无法读取文件, 跳过: {entry.path} ({e})',
+                            'WARNING')
+                known = index.set_files(parent_dir, file_stats)
+                for path, file_stat in file_stats.items():
+                    old = known.get(path)
+                    if old is None or not old[3] or old[:3] != (
+                            file_stat.st_size, file_stat.st_mtime,
+                            file_stat.st_ino):
+                        yield path
+                index.set_dir(parent_dir, stat, ignored, subdirs)
+        if recursive:
+            for subdir in subdirs:
+                yield from _scan(subdir)
+
+    # 逐个目录惰性产出, 调用方无需等待全部扫描完成
+    yield from _scan(os.path.realpath(target_dir))
+
+
+# 番号规则表, 按顺序匹配, 首个命中的规则生效
+CODENAME_RULES = [
+    ('fc2', r'(FC|fc)2[-_]?((PPV|ppv)[-_])?\d{6,7}'),  # FC2番号
+    ('standard',
+     r'((?<=[^A-Za-z])|^)([A-Z]|[a-z]){2,5}[-_]?\d{3,5}(?!(\d|[A-Za-z0-9]{3,}))'
+     ),  # 常见番号
+    ('uncensored',
+     r'((?<=[^A-Za-z0-9])|^)\d{6,7}[-_]\d{3,4}(?!(\d|[A-Za-z0-9]{3,}))'
+     ),  # 无码番号: 一本道/加勒比
+]
+
+# 优先使用libyaml的C实现
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YamlDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+# JSON副本中番号固定为第一个键, 只需读取文件头部即可取得
+SIDECAR_HEAD = re.compile(rb'\{"codename":("(?:[^"\\]|\\.)*")')
+
+
+def sidecar_path(info_path: str) -> str:
+    # gavdener-info.yml -> gavdener-info.json
+    root, ext = os.path.splitext(info_path)
+    return f'{info_path}.json' if ext == '.json' else f'{root}.json'
+
+
+def dump_info(info, sidecar: bool = False) -> Tuple[bytes, bytes | None]:
+    # 序列化一次, 写入多个目录(主演员/其他演员)时复用同一份数据
+    data = info.to_dict()
+    text = yaml.dump(data,
+                     Dumper=YamlDumper,
+                     indent=2,
+                     allow_unicode=True,
+                     sort_keys=False)
+    if not sidecar:
+        return text.encode('utf-8'), None
+    compact = json.dumps(data, ensure_ascii=False,
+                         separators=(',', ':')).encode('utf-8')
+    return text.encode('utf-8'), compact
+
+
+def load_info(info_path: str) -> dict | None:
+    # 优先读取JSON副本, 不存在时解析YAML
+    try:
+        with open(sidecar_path(info_path), 'rb') as fp:
+            return json.loads(fp.read())
+    except FileNotFoundError:
+        pass
+    except ValueError:
+        log(f'info副本有误, 改为读取info文件: {info_path}', 'WARNING')
+    if not os.path.isfile(info_path):
+        return None
+    with open(info_path, 'rb') as fp:
+        return yaml.load(fp, Loader=YamlLoader)
+
+
+def load_codename(info_path: str) -> str | None:
+    # 只需番号时从JSON副本头部直接截取, 不解析整个文件
+    try:
+        with open(sidecar_path(info_path), 'rb') as fp:
+            match = SIDECAR_HEAD.match(fp.read(512))
+        if match:
+            return json.loads(match.group(1))
+    except FileNotFoundError:
+        pass
+    data = load_info(info_path)
+    return None if data is None else data['codename']
+
+
+# 容量有限的字典, 超出后淘汰最久未使用的条目, 可在多个线程间共用
+class LRUCache:
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def __getitem__(self, key):
+        with self._lock:
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class CodenameExtractor:
+
+    def __init__(self,
+                 info_file: str = 'info.yaml',
+                 rules: List[Tuple[str, str]] = CODENAME_RULES,
+                 cache_size: int = 1024):
+        self.info_file = info_file
+        self.rules = [(name, re.compile(pattern)) for name, pattern in rules]
+        self.cache_size = cache_size
+        self._dirs: OrderedDict[str, str | None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_rule(self, name: str, pattern: str, position: int = -1):
+        rule = (name, re.compile(pattern))
+        if position < 0:
+            self.rules.append(rule)
         else:
-            return (text1, text2)[ret_id]
-    else:
-        return text1[astart:astart + size]
+            self.rules.insert(position, rule)
+
+    def match(self, text: str) -> str | None:
+        for _, pattern in self.rules:
+            match_res = pattern.search(text)
+            if match_res is not None:
+                return match_res.group(0)
+        return None
+
+    def match_all(self, text: str) -> List[str]:
+        # 按规则顺序列出文本中的全部番号, 首个与 match() 的结果相同
+        return [
+            match_res.group(0) for _, pattern in self.rules
+            for match_res in pattern.finditer(text)
+        ]
+
+    def dir_codename(self, filedir: str) -> str | None:
+        # 每个目录只读取一次info文件, 结果按LRU缓存
+        with self._lock:
+            if filedir in self._dirs:
+                self._dirs.move_to_end(filedir)
+                return self._dirs[filedir]
+        codename = None
+        info_path = os.path.join(filedir, self.info_file)
+        try:
+            codename = load_codename(info_path)
+            if codename is not None:
+                log(f'找到info文件: {info_path}')
+        except:
+            log(f'info文件有误: {info_path}')
+        with self._lock:
+            self._dirs[filedir] = codename
+            if len(self._dirs) > self.cache_size:
+                self._dirs.popitem(last=False)
+        return codename
+
+    def extract(self, filepath: str) -> str:
+        filedir, filename = os.path.split(filepath)
+        return self.extract_batch(filedir, [filename])[filename]
+
+    def extract_batch(self, filedir: str,
+                      filenames: Iterable[str]) -> Dict[str, str]:
+        codename = self.dir_codename(filedir)
+        if codename is not None:
+            return {filename: codename for filename in filenames}
+        # 文件名中有多个番号时, 优先取与所在目录路径中番号一致的一个
+        dir_keys = {codename_key(code) for code in self.match_all(filedir)}
+        result = dict()
+        for filename in filenames:
+            codes = self.match_all(filename)
+            result[filename] = next(
+                (code for code in codes if codename_key(code) in dir_keys),
+                codes[0] if codes else os.path.splitext(filename)[0])
+        return result
+
+
+_extractors: Dict[str, CodenameExtractor] = dict()
+
+
+def get_extractor(info_file: str = 'info.yaml') -> CodenameExtractor:
+    if info_file not in _extractors:
+        _extractors[info_file] = CodenameExtractor(info_file)
+    return _extractors[info_file]
 
 
 def get_codename(filepath: str, info_file: str = 'info.yaml') -> str:
-    filename = os.path.basename(filepath)
-    filedir = os.path.dirname(filepath)
-
-    if info_file in os.listdir(filedir):
-        log(f'找到info文件: {filepath}')
-        info_path = os.path.join(filedir, info_file)
-        with open(info_path, 'r', encoding='utf-8') as fp:
-            data: dict = yaml.Loader(fp).get_data()
+    return get_extractor(info_file).extract(filepath)
+
+
+def set_mark(path: str,
+             info=None,
+             ignore_file: str = 'gavdener.ignore',
+             info_file: str = 'info.yaml',
+             sidecar: bool = False,
+             payload: Tuple[bytes, bytes | None] | None = None):
+    # payload: dump_info() 的结果, 同一影片写入多个目录时由调用方传入
+    if os.path.isdir(path):
+        target_dir = path
+    else:
+        target_dir = os.path.dirname(path)
+    if not os.path.isdir(target_dir):
+        log(f'停止添加标记, 目标路径未指向目录或文件: {path}', 'WARNING')
+        return 1
+
+    if info is None:
+        filename = ignore_file
+    else:
+        filename = info_file
+    target_path = os.path.join(target_dir, filename)
+    with stats.timer('mark'):
+        if info is None:
+            log(f'标记为无效路径: {target_dir}')
+            open(target_path, 'wb').close()
+            return 0
+        log(f'添加标记: {target_dir}')
+        text, compact = payload or dump_info(info, sidecar)
+        with open(target_path, 'wb') as fp:
+            fp.write(text)
+        # 未启用副本时删除旧副本, 以免读取到过期信息
+        if compact is None:
             try:
-                return data["codename"]
-            except:
-                log(f'info文件有误: {info_path}')
-    name = common_part(filename, filedir, 0)
-
-    codename = None
-
-    matcher = [
-        re.compile(r'(FC|fc)2[-_]?((PPV|ppv)[-_])?\d{6,7}'),  # FC2番号
-        re.compile(
-            r'((?<=[^A-Za-z])|^)([A-Z]|[a-z]){2,5}[-_]?\d{3,5}(?!(\d|[A-Za-z0-9]{3,}))'
-        ),  # 常见番号
-        re.compile(
-            r'((?<=[^A-Za-z0-9])|^)\d{6,7}[-_]\d{3,4}(?!(\d|[A-Za-z0-9]{3,}))'
-        )  # 无码番号: 一本道/加勒比
+                os.remove(sidecar_path(target_path))
+            except FileNotFoundError:
+                pass
+        else:
+            with open(sidecar_path(target_path), 'wb') as fp:
+                fp.write(compact)
+        stats.add_bytes('mark', len(text) + len(compact or b''))
+    return 0
+
+
+def codename_key(text: str) -> str:
+    # 规范化番号用于比较: 忽略大小写/分隔符/数字前导0, FC2番号忽略PPV
+    # 如 FC2-PPV-0123456 / fc2ppv_123456 -> FC-2-123456, abp00123 -> ABP-123;
+    # 非番号的名称保留其中的文字(含中日文), 只由符号组成时原样比较
+    parts = [
+        part.lstrip('0') or '0' if part.isdigit() else part
+        for part in _key_parts.findall(text.upper())
     ]
+    return '-'.join(parts).replace('FC-2-PPV-', 'FC-2-') or text.strip()
+
+
+_key_parts = re.compile(r'[^\W\d_]+|\d+')
 
-    while codename is None:
-        try:
-            match_res = re.search(matcher.pop(0), name)
-            if match_res is not None:
-                codename = match_res.group(0)
-        except IndexError:
-            codename = os.path.splitext(filename)[0]
-            # codename = filename
 
-    return codename
+def edit_distance(text1: str, text2: str, bound: int) -> int:
+    # 带上限的编辑距离, 超过上限时提前返回 bound + 1
+    if abs(len(text1) - len(text2)) > bound:
+        return bound + 1
+    previous = list(range(len(text2) + 1))
+    for i, char1 in enumerate(text1, 1):
+        current = [i]
+        for j, char2 in enumerate(text2, 1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1,
+                    previous[j - 1] + (char1 != char2)))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return previous[-1]
+
+
+# 在候选番号中查找最接近的一个: 规范化后哈希查找, 其次包含关系, 最后在编号相同的候选间比较编辑距离
+class CodenameMatcher:
+
+    def __init__(self, candidates: Iterable[str], max_distance: int = 2):
+        self.max_distance = max_distance
+        self.keys: Dict[str, str] = dict()
+        # 编号部分 -> 规范化番号, 编辑距离只在编号相同的候选之间比较
+        self.numbers: Dict[str, List[str]] = dict()
+        for candidate in candidates:
+            key = codename_key(candidate)
+            if key not in self.keys:
+                self.keys[key] = candidate
+                self.numbers.setdefault(key.rsplit('-', 1)[-1],
+                                        list()).append(key)
+
+    def match(self, text: str) -> str | None:
+        key = codename_key(text)
+        if not key:
+            return None
+        candidate = self.keys.get(key)
+        if candidate is not None:
+            return candidate
+        # 查询文本中带有多余前后缀, 如 hhd800.com@ABP-123
+        wrapped = f'-{key}-'
+        contained = [
+            other for other in self.keys
+            if other.count('-') and (f'-{other}-' in wrapped or
+                                     wrapped in f'-{other}-')
+        ]
+        if contained:
+            return self.keys[max(contained, key=len)]
+        # 只容许前缀有差异(如 ABP-123 / APB-123), 编号不同的视为不同影片;
+        # 距离相同时保持候选顺序
+        ranked = [(edit_distance(key, other, self.max_distance), idx, other)
+                  for idx, other in enumerate(
+                      self.numbers.get(key.rsplit('-', 1)[-1], ()))]
+        best = min(ranked, default=None)
+        if best is None or best[0] > self.max_distance:
+            return None
+        return self.keys[best[2]]
 
 
 def get_most_like(text: str, possibilities: list) -> str | None:
-    cmp_text = text.casefold()
-    cmp_list = list(map(str.casefold, possibilities))
-    result = get_close_matches(cmp_text, cmp_list, n=3, cutoff=0.4)
-    if result:
-        res_idx = cmp_list.index(result[0])
-        return possibilities[res_idx]
-    else:
-        return None
+    return CodenameMatcher(possibilities).match(text)
 
 
 if __name__ == "__main__":
     a = get_config()
-    lst = file_scanner(r"F:\Watch\AD", include=a.scrapper.target_exts)
+    lst = list(file_scanner(r"F:\Watch\AD", include=a.scrapper.target_exts))
     print(lst)
     # b = get_codename(r"F:\Watch\AD\FC2-PPV-3087371\hhd800.com@FC2-PPV-3087371.mp4")
     for i in lst:
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Iterable, Iterator, List
+
+from exts import log
+from stats import stats
+
+# 文件依次经历的状态; done 为最终结果(status: moved/failed/skipped/unresolved)
+STATES = ('scanned', 'resolved', 'marked', 'moved', 'linked', 'done')
+
+
+# 运行记录: 追加写入的 JSON Lines, 每条记录立即写入文件, 每 sync_every 条或每
+# sync_interval 秒 fsync 一次; 移动/链接等不可重做的操作在执行前单独 fsync.
+# 进程中断后再次运行时可据此跳过已完成的文件, 复用已解析的影片信息
+class Journal:
+
+    def __init__(self,
+                 path: str = 'gavdener-journal.jsonl',
+                 resume: bool = False,
+                 sync_every: int = 64,
+                 sync_interval: float = 1.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.entries: Dict[str, dict] = self.replay(path) if resume else dict()
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._synced = time.monotonic()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 不继续上次运行时重新开始记录
+        self._fp = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if resume:
+            log(f'继续上次运行: {path}, 已记录{len(self.entries)}项')
+            # 上次中断时未写完的行单独结束, 避免与新记录拼接
+            if self._fp.tell() and not self._ends_with_newline(path):
+                self._fp.write('\n')
+
+    @staticmethod
+    def _ends_with_newline(path: str) -> bool:
+        with open(path, 'rb') as fp:
+            fp.seek(-1, os.SEEK_END)
+            return fp.read(1) == b'\n'
+
+    @staticmethod
+    def replay(path: str) -> Dict[str, dict]:
+        # 按路径合并各条记录, 状态取最后一条; 中断时只写了一半的行直接忽略
+        entries: Dict[str, dict] = dict()
+        if not os.path.isfile(path):
+            return entries
+        with open(path, 'r', encoding='utf-8') as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                entries.setdefault(record.pop('path'), dict()).update(record)
+        return entries
+
+    def record(self, path: str, state: str, sync: bool = False, **fields):
+        line = json.dumps(dict(path=path, state=state, **fields),
+                          ensure_ascii=False)
+        with self._lock:
+            self._fp.write(f'{line}\n')
+            # 进程退出时不会丢失已写入的记录, 只有系统崩溃时才依赖 fsync
+            self._fp.flush()
+            self._unsynced += 1
+            if (sync or self._unsynced >= self.sync_every or
+                    time.monotonic() - self._synced >= self.sync_interval):
+                self._sync()
+
+    def _sync(self):
+        with stats.timer('journal.sync'):
+            os.fsync(self._fp.fileno())
+        self._unsynced = 0
+        self._synced = time.monotonic()
+
+    def state(self, path: str) -> str | None:
+        entry = self.entries.get(path)
+        return None if entry is None else entry['state']
+
+    def track(self, movies: Iterable[str]) -> Iterator[str]:
+        # 跳过上次运行中已解析过的文件, 其余记录为已扫描
+        for movie in movies:
+            if self.state(movie) not in (None, 'scanned'):
+                stats.incr('journal.skipped')
+                continue
+            self.record(movie, 'scanned')
+            yield movie
+
+    def unfinished(self) -> List[str]:
+        # 已解析出影片信息但尚未完成整理的文件
+        return [
+            path for path, entry in self.entries.items()
+            if entry['state'] not in ('scanned', 'done') and entry.get('info')
+        ]
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._fp.close()
@@ -0,0 +1,210 @@
+import os
+import json
+import shutil
+import traceback
+from typing import Dict, List, Set
+
+from spiders import MovieInfo
+from stats import stats
+from exts import log, set_mark, dump_info, Config
+from catalog import Catalog
+
+# 执行顺序: 先写标记并移动文件, 再为其余演员创建链接
+PHASES = {'mark': 0, 'move': 0, 'link': 1}
+
+
+# 两阶段整理: 先在内存中生成完整的移动/链接计划并写入计划文件, 再按目标目录批量执行
+class MovePlanner:
+
+    def __init__(self, config: Config):
+        self.target_root = config.general.target_dir
+        self.multi_actors = config.scrapper.multi_actors
+        self.ops: List[dict] = list()
+        self.marks: Dict[str, dict | None] = dict()
+        # 目标目录 -> {文件名: inode}, 每个目录只列举一次, 重名在内存中解决
+        self._listings: Dict[str, Dict[str, int]] = dict()
+
+    def listing(self, dirpath: str) -> Dict[str, int]:
+        if dirpath not in self._listings:
+            names = dict()
+            try:
+                with os.scandir(dirpath) as entries:
+                    for entry in entries:
+                        names[entry.name] = entry.inode()
+            except FileNotFoundError:
+                pass
+            self._listings[dirpath] = names
+        return self._listings[dirpath]
+
+    def add(self, path: str, info: MovieInfo):
+        main_actor = info.actors[0] if info.actors else info.default_text
+        other_actors = info.actors[1:] if len(info.actors) > 1 else list()
+        target_dir = os.path.join(self.target_root, main_actor, info.codename)
+        filename = os.path.basename(path)
+        source_ino = os.stat(path).st_ino
+
+        names = self.listing(target_dir)
+        root, ext = os.path.splitext(filename)
+        target_name, i = filename, 0
+        # 确保没有文件会被覆盖
+        while target_name in names:
+            if names[target_name] == source_ino:
+                log(f'文件指向相同: {path} == {target_name}')
+                break
+            i += 1
+            target_name = f'{root}-{i}{ext}'
+        target_path = os.path.join(target_dir, target_name)
+        self.marks[target_dir] = info.to_dict()
+        if names.get(target_name) != source_ino:
+            names[target_name] = source_ino
+            self.ops.append(dict(op='move', src=path, dst=target_path))
+
+        # 创建链接
+        if self.multi_actors:
+            for actor in other_actors:
+                tmp_dir = os.path.join(self.target_root, actor, info.codename)
+                tmp_names = self.listing(tmp_dir)
+                if filename not in tmp_names:
+                    tmp_names[filename] = source_ino
+                    self.ops.append(
+                        dict(op='link',
+                             src=target_path,
+                             dst=os.path.join(tmp_dir, filename)))
+                self.marks[tmp_dir] = info.to_dict()
+
+    def plan(self) -> List[dict]:
+        ops = [dict(op='mark', dir=dirpath, info=info)
+               for dirpath, info in self.marks.items()] + self.ops
+        # 按阶段和目标目录分组, 同一目录的操作连续执行
+        ops.sort(key=lambda op: (PHASES[op['op']],
+                                 op.get('dir') or os.path.dirname(op['dst']),
+                                 op['op'] != 'mark'))
+        for idx, op in enumerate(ops):
+            op['id'] = idx
+        return ops
+
+    def write(self, plan_path: str) -> int:
+        ops = self.plan()
+        with open(plan_path, 'w', encoding='utf-8') as fp:
+            for op in ops:
+                fp.write(json.dumps(op, ensure_ascii=False) + '\n')
+        log(f'已生成整理计划: {plan_path}, 共{len(ops)}项操作')
+        return len(ops)
+
+
+def load_plan(plan_path: str) -> List[dict]:
+    with open(plan_path, 'r', encoding='utf-8') as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+def load_done(done_path: str) -> Set[int]:
+    if not os.path.isfile(done_path):
+        return set()
+    with open(done_path, 'r', encoding='utf-8') as fp:
+        return {int(line) for line in fp if line.strip().isdigit()}
+
+
+def move_file(src: str, dst: str):
+    # 同一文件系统内直接重命名, 跨文件系统时再复制
+    try:
+        os.rename(src, dst)
+    except OSError:
+        shutil.move(src, dst)
+
+
+def apply_op(op: dict,
+             config: Config,
+             payloads: Dict[str, tuple] | None = None):
+    if op['op'] == 'mark':
+        info = None if op['info'] is None else MovieInfo(**op['info'])
+        sidecar = config.general.info_sidecar
+        payload = None
+        if info is not None and payloads is not None:
+            # 同一影片的多个目录复用序列化结果
+            key = json.dumps(op['info'], ensure_ascii=False)
+            if key not in payloads:
+                payloads[key] = dump_info(info, sidecar)
+            payload = payloads[key]
+        set_mark(op['dir'],
+                 info,
+                 ignore_file=config.general.ignore_file,
+                 info_file=config.general.info_file,
+                 sidecar=sidecar,
+                 payload=payload)
+    elif op['op'] == 'move':
+        if not os.path.exists(op['src']) and os.path.exists(op['dst']):
+            log(f'文件已移动, 跳过: {op["dst"]}')
+        elif os.path.exists(op['dst']):
+            # 生成计划后目标位置出现了其他文件, 不能覆盖; 本项记为失败, 下次运行重新规划
+            if os.path.samefile(op['src'], op['dst']):
+                log(f'文件指向相同, 跳过: {op["src"]} == {op["dst"]}')
+            else:
+                raise FileExistsError(f'目标文件已存在, 拒绝覆盖: {op["dst"]}')
+        elif config.general.debug:
+            log(f'移动文件: {op["src"]} -> {op["dst"]}', 'debug')
+        else:
+            log(f'移动文件: {op["src"]} -> {op["dst"]}', 'info')
+            with stats.timer('move.file'):
+                move_file(op['src'], op['dst'])
+    elif op['op'] == 'link':
+        if os.path.exists(op['dst']):
+            log(f'链接已存在, 跳过: {op["dst"]}')
+        elif os.path.isfile(op['src']):
+            log(f'创建链接: {op["dst"]} -> {op["src"]}')
+            with stats.timer('link'):
+                os.link(op['src'], op['dst'])
+
+
+def apply_plan(plan_path: str,
+               config: Config,
+               sync_every: int = 64,
+               catalog: Catalog = None) -> int:  # type: ignore
+    # 已完成的操作编号记录在 <计划文件>.done 中, 中断后再次执行会从断点继续;
+    # 调试模式下文件并未移动, 不记录完成状态, 之后仍可正式执行同一计划
+    ops = load_plan(plan_path)
+    # 目标目录 -> 影片信息, 移动/链接完成后写入影片目录
+    infos = {op['dir']: op['info'] for op in ops if op['op'] == 'mark'}
+    done_path = f'{plan_path}.done'
+    done = load_done(done_path)
+    if done:
+        log(f'继续执行整理计划: {plan_path}, 已完成{len(done)}/{len(ops)}项')
+    failed = 0
+    # 移动失败的目标路径, 以其为源的链接不能执行
+    failed_moves: Set[str] = set()
+    made_dirs: Set[str] = set()
+    payloads: Dict[str, tuple] = dict()
+    with open(done_path, 'a', encoding='utf-8') as done_fp:
+        for op in ops:
+            if op['id'] in done:
+                continue
+            dirpath = op.get('dir') or os.path.dirname(op['dst'])
+            if op['op'] == 'link' and op['src'] in failed_moves:
+                failed += 1
+                log(f'源文件未移动, 跳过链接: {op["dst"]} -> {op["src"]}', 'ERROR')
+                continue
+            try:
+                if dirpath not in made_dirs:
+                    os.makedirs(dirpath, exist_ok=True)
+                    made_dirs.add(dirpath)
+                apply_op(op, config, payloads)
+                if (catalog is not None and op['op'] != 'mark' and
+                        infos.get(dirpath) and not config.general.debug and
+                        os.path.isfile(op['dst'])):
+                    catalog.add([op['dst']], infos[dirpath])
+            except Exception:
+                failed += 1
+                if op['op'] == 'move':
+                    failed_moves.add(op['dst'])
+                log(traceback.format_exc(), 'ERROR')
+                continue
+            if config.general.debug:
+                continue
+            done_fp.write(f'{op["id"]}\n')
+            done.add(op['id'])
+            if len(done) % sync_every == 0:
+                done_fp.flush()
+                os.fsync(done_fp.fileno())
+        done_fp.flush()
+        os.fsync(done_fp.fileno())
+    log(f'整理计划执行完毕: {plan_path}, 成功{len(ops) - failed}项, 失败{failed}项')
+    return failed
@@ -1,12 +1,40 @@
 import re
+import time
+import random
+import threading
 import traceback
-from urllib.parse import quote
-from typing import Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+from typing import Dict, List, Set, Tuple
 
-import requests as req
-from lxml import etree
+from exts import get_most_like, get_config, log, TokenBucket, LRUCache
+from stats import stats
 
-from exts import get_most_like, get_config, log
+
+# requests/lxml 导入耗时较长, 推迟到首次联网或解析页面时,
+# 只命中缓存的运行无需加载
+def _requests():
+    import requests
+    return requests
+
+
+def _etree():
+    from lxml import etree
+    return etree
+
+
+# 类定义时只记录表达式, 首次使用时编译
+class XPath:
+    __slots__ = ('path', '_compiled')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._compiled = None
+
+    def __call__(self, node, **variables):
+        if self._compiled is None:
+            self._compiled = _etree().XPath(self.path)
+        return self._compiled(node, **variables)
 
 
 class MovieInfo:
@@ -36,60 +64,245 @@ class MovieInfo:
                     tags=self.tags)
 
 
+_parsers = threading.local()
+# 查询失败原因: http 为暂时性错误, 其余视为站点上确实无法获取
+# cancelled: 同时查询的其他站点已先返回结果, 不记录失败
+FAILURE_RANK = {'not_found': 0, 'parse': 1, 'http': 2, 'cancelled': 3}
+
+
 class Spider:
     baseurl = 'https://www.baidu.com/'
+    # 可替换的传输层(requests适配器), 用于离线测试时返回本地页面
+    transport = None
 
     def __init__(self):
+        self.site = type(self).__name__.lower()
+        self.cache = None
+        self._slots = threading.BoundedSemaphore(1)
+        self.timeout = 5
+        self.retry = 1
+        self.backoff = 1.0
+        self.backoff_max = 30.0
+        self.bucket = TokenBucket(rate=0)
+        # 熔断: 连续失败达到上限后, 冷却期内不再请求该站点
+        self.breaker_failures = 5
+        self.breaker_cooldown = 300.0
+        self.failures = 0
+        self.open_until = 0.0
+        # 当前线程本次查询中遇到的失败原因, 用于写入失败记录
+        self._state = threading.local()
+        # 收录演员/系列列表页: 每个链接最多抓取的页数, 0为关闭
+        self.harvest_pages = 0
+        self._harvested: Set[str] = set()
+        self._harvest_lock = threading.Lock()
+        self._harvester: ThreadPoolExecutor | None = None
+        # 关闭时通知正在进行的收录任务停止
+        self._closing = threading.Event()
+        self._pool: ThreadPoolExecutor | None = None
+        self.concurrency = 1
+        # 本次运行中的页面/影片信息只保留最近使用的部分, 常驻运行时内存不随影片数量增长;
+        # 完整的页面与信息由 MetaCache 持久保存
+        self.pages = LRUCache(maxsize=64)
+        self.infos = LRUCache(maxsize=1024)
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.pool_size = 4
         self.req_conf = dict({
             "headers": {
                 "User-Agent":
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36 Edg/108.0.1462.54"
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36 Edg/108.0.1462.54",
+                "Connection": "keep-alive"
             }
         })
 
     @property
-    def infos(self) -> dict:
-        if not hasattr(self, "_infos"):
-            self._infos = dict()
-        return self._infos
-
-    @property
-    def pages(self):
-        if not hasattr(self, '_pages'):
-            self._pages = dict()
-        return self._pages
+    def session(self):
+        # 首次请求时才创建会话
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = _requests().Session()
+                    # 明确声明可接受的压缩格式, 安装brotli时包含br
+                    from urllib3.util.request import ACCEPT_ENCODING
+                    session.headers['Accept-Encoding'] = ', '.join(
+                        ACCEPT_ENCODING.split(','))
+                    self._mount(session)
+                    self._session = session
+        return self._session
+
+    def _mount(self, session):
+        adapter = _requests().adapters.HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if self.transport is not None:
+            session.mount(self.baseurl, self.transport)
 
     def get_html(self,
                  url: str,
                  params: dict = dict(),
                  data: dict = dict(),
-                 timeout: int = 5,
-                 retry: int = 1):
-        try:
-            result = self.pages.get(url)
-            if result is None:
-                while retry > 0:
-                    try:
-                        cur_page = req.get(url=url,
-                                           params=params,
-                                           data=data,
-                                           timeout=timeout,
-                                           **self.req_conf)  # type: ignore
-                        assert cur_page.status_code == 200
-                        break
-                    except:
-                        log(f'请求失败: {url}', 'WARNING')
-                        # log(traceback.format_exc(), "ERROR")
-                        retry -= 1
-                    finally:
-                        if retry <= 0:
-                            log(f'请求失败, 不再重试: {url}', 'ERROR')
-                if retry > 0:
-                    cur_page.encoding = cur_page.apparent_encoding  # type: ignore
-                    result = self.pages[url] = cur_page.text  # type: ignore
+                 timeout: int = None,  # type: ignore
+                 retry: int = None):  # type: ignore
+        timeout = self.timeout if timeout is None else timeout
+        retry = self.retry if retry is None else retry
+        result = self.pages.get(url)
+        if result is None and self.cache is not None and self.cache.keep_html:
+            result = self.cache.get_page(url)
+            stats.incr(f'{self.site}.page_cache_' +
+                       ('miss' if result is None else 'hit'))
+        if result is not None:
             return result
-        except:
-            raise  # TODO 异常处理
+        if not self.healthy:
+            log(f'站点已熔断, 跳过请求: {url}', 'WARNING')
+            stats.incr(f'{self.site}.breaker_skip')
+            self.note_failure('http')
+            return None
+
+        # 已保存校验信息的页面发送条件请求, 未变化时站点只返回304
+        validated, req_conf = None, self.req_conf
+        if self.cache is not None:
+            validated = self.cache.get_validated(url)
+        if validated is not None:
+            headers = dict(self.req_conf['headers'])
+            if validated[1]:
+                headers['If-None-Match'] = validated[1]
+            if validated[2]:
+                headers['If-Modified-Since'] = validated[2]
+            req_conf = dict(self.req_conf, headers=headers)
+
+        cur_page = None
+        for attempt in range(retry):
+            if attempt > 0:
+                stats.incr(f'{self.site}.retry')
+                self.pause(self.get_backoff(attempt, cur_page))
+            try:
+                self.bucket.acquire()
+                with self._slots, stats.timer(f'{self.site}.fetch'):
+                    # 等待限速/并发名额期间查询可能已被取消
+                    if self.cancelled():
+                        log(f'查询已取消, 不再请求: {url}')
+                        stats.incr(f'{self.site}.cancelled')
+                        self.note_failure('cancelled')
+                        return None
+                    cur_page = self.session.get(url=url,
+                                                params=params,
+                                                data=data,
+                                                timeout=timeout,
+                                                **req_conf)  # type: ignore
+                stats.add_bytes(f'{self.site}.fetch', self.wire_size(cur_page))
+                if cur_page.status_code == 200 or (
+                        cur_page.status_code == 304 and validated is not None):
+                    break
+                if cur_page.status_code == 404:
+                    # 站点正常, 只是页面不存在, 无需重试也不计入熔断
+                    log(f'页面不存在: {url}', 'WARNING')
+                    self.record_success()
+                    self.note_failure('not_found')
+                    return None
+                log(f'请求失败({cur_page.status_code}): {url}', 'WARNING')
+            except _requests().RequestException:
+                log(f'请求失败: {url}', 'WARNING')
+                # log(traceback.format_exc(), "ERROR")
+                cur_page = None
+        else:
+            log(f'请求失败, 不再重试: {url}', 'ERROR')
+            stats.incr(f'{self.site}.request_failed')
+            self.record_failure()
+            self.note_failure('http')
+            return None
+
+        self.record_success()
+
+        etag = cur_page.headers.get('ETag')  # type: ignore
+        modified = cur_page.headers.get('Last-Modified')  # type: ignore
+        if cur_page.status_code == 304:  # type: ignore
+            stats.incr(f'{self.site}.not_modified')
+            self.cache.touch_validated(url, etag, modified)
+            result = self.pages[url] = validated[0]  # type: ignore
+            return result
+
+        result = self.pages[url] = self.decode(cur_page)  # type: ignore
+        if self.cache is not None:
+            self.cache.set_page(url, result)
+            self.cache.set_validated(url, result, etag, modified)
+        return result
+
+    @staticmethod
+    def wire_size(response) -> int:
+        # 按实际传输(压缩后)的字节数统计, 与代理计费的流量一致
+        try:
+            return response.raw.tell()
+        except AttributeError:
+            return len(response.content)
+
+    @staticmethod
+    def decode(response) -> str:
+        # 直接按声明的编码(默认utf-8)解码, 仅在失败时才进行耗时的编码探测
+        charset = _requests().utils.get_encoding_from_headers(
+            response.headers)
+        if charset is None or charset.lower() == 'iso-8859-1':
+            charset = 'utf-8'
+        try:
+            return response.content.decode(charset)
+        except (UnicodeDecodeError, LookupError):
+            response.encoding = response.apparent_encoding
+            return response.text
+
+    def cancelled(self) -> bool:
+        cancel = getattr(self._state, 'cancel', None)
+        return cancel is not None and cancel.is_set()
+
+    def pause(self, seconds: float):
+        # 重试等待期间被取消时立即返回
+        cancel = getattr(self._state, 'cancel', None)
+        if cancel is None:
+            time.sleep(seconds)
+        else:
+            cancel.wait(seconds)
+
+    def submit(self, fn, *args) -> Future:
+        # 多站点同时查询时各站点使用各自的线程池, 慢站点不会占满其他站点的线程
+        with self._harvest_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.concurrency * 2,
+                    thread_name_prefix=f'{self.site}-lookup')
+        return self._pool.submit(fn, *args)
+
+    def note_failure(self, reason: str):
+        # 网络错误优先于解析错误, 解析错误优先于页面不存在
+        current = getattr(self._state, 'reason', None)
+        if FAILURE_RANK[reason] > FAILURE_RANK.get(current, -1):
+            self._state.reason = reason
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.breaker_failures > 0:
+            self.open_until = time.monotonic() + self.breaker_cooldown
+            self.failures = 0
+            log(f'站点连续请求失败, 暂停{self.breaker_cooldown}秒: {self.site}',
+                'WARNING')
+            stats.incr(f'{self.site}.breaker_open')
+
+    def get_backoff(self, attempt: int, response=None) -> float:
+        # 服务端明确要求等待时优先遵循Retry-After
+        if response is not None and response.status_code in (429, 503):
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(self.backoff_max, float(retry_after))
+        # 指数退避 + 随机抖动, 避免多个线程同时重试
+        delay = min(self.backoff_max, self.backoff * 2**(attempt - 1))
+        return random.uniform(delay / 2, delay)
 
     def get_etree(self,
                   url: str,
@@ -98,55 +311,237 @@ class Spider:
                   **kwargs):
         html = self.get_html(url, params, data, **kwargs)
         try:
-            tree = etree.HTML(html)  # type: ignore
+            with stats.timer(f'{self.site}.parse'):
+                tree = self.parse(html)  # type: ignore
         except ValueError:
             log(f"HTML异常, 不再尝试: {url}", 'ERROR')
+            if html is not None:
+                self.note_failure('parse')
             tree = None
 
         return tree
 
+    def parse(self, html: str):
+        # <head>中的脚本与样式与提取无关, 只解析<body>部分;
+        # lxml会补全html/body, 绝对路径的XPath依然有效
+        if html is None:
+            raise ValueError('empty page')
+        start = html.find('<body')
+        if start > 0:
+            html = html[start:]
+        if not hasattr(_parsers, 'html'):
+            # 解析器不能跨线程共用, 每个线程各自持有一个
+            _parsers.html = _etree().HTMLParser(remove_comments=True,
+                                                remove_pis=True)
+        return _etree().fromstring(html, _parsers.html)
+
     def set_proxies(self, proxies: dict):
-        self.req_conf['proxies'] = proxies
+        # requests 会向其中补充环境变量中的代理, 不能直接使用只读的配置
+        self.req_conf['proxies'] = dict(proxies or dict())
 
     def set_cookies(self, cookies: dict):
         self.req_conf['cookies'] = cookies
 
-    def get_list_by_xpath(self, url: str, stmt: str):
+    def set_cache(self, cache):
+        self.cache = cache
+
+    def set_concurrency(self, limit: int):
+        # 限制同一站点同时进行的请求数
+        self.concurrency = max(1, limit)
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+
+    def set_pool_size(self, size: int):
+        # 复用连接, 避免每个请求都重新经过代理握手
+        self.pool_size = size
+        if self._session is not None:
+            self._mount(self._session)
+
+    def set_rate_limit(self, rate: float, burst: int = 1):
+        self.bucket = TokenBucket(rate=rate, burst=burst)
+
+    def configure(self, conf: dict):
+        self.timeout = conf.get('timeout', self.timeout)
+        self.retry = conf.get('retry', self.retry)
+        self.backoff = conf.get('backoff', self.backoff)
+        self.backoff_max = conf.get('backoff_max', self.backoff_max)
+        self.breaker_failures = conf.get('breaker_failures',
+                                         self.breaker_failures)
+        self.breaker_cooldown = conf.get('breaker_cooldown',
+                                         self.breaker_cooldown)
+        self.harvest_pages = conf.get('harvest_pages', self.harvest_pages)
+        if 'pool_size' in conf:
+            self.set_pool_size(conf['pool_size'])
+        if 'rate' in conf:
+            self.set_rate_limit(conf['rate'], conf.get('burst', 1))
+
+    def get_list_by_xpath(self, url: str, stmt: str | XPath):
         res_tree = self.get_etree(url)
         if res_tree is None:
             return list()
+        elif isinstance(stmt, XPath):
+            return list(stmt(res_tree))
         else:
             return [i for i in res_tree.xpath(stmt)]
 
     def get_codename(self, text: str) -> Tuple[str, str] | str | None:
         pass
 
+    def listing_url(self, link: str, page: int) -> str:  # type: ignore
+        pass
+
+    def parse_listing(self, tree) -> Dict[str, str]:  # type: ignore
+        # 返回列表页中的 番号 -> 详情页地址
+        pass
+
+    def schedule_harvest(self, links: List[str]):
+        # 在后台逐个抓取演员/系列列表页, 不阻塞当前影片的处理
+        if self.harvest_pages <= 0 or self.cache is None:
+            return
+        with self._harvest_lock:
+            links = [link for link in links if link not in self._harvested]
+            self._harvested.update(links)
+            if not links:
+                return
+            if self._harvester is None:
+                self._harvester = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f'{self.site}-harvest')
+            for link in links:
+                self._harvester.submit(self.harvest, link)
+
+    def harvest(self, link: str) -> int:
+        if self.cache.harvested(self.site, link):
+            return 0
+        total = 0
+        self._state.cancel = self._closing
+        try:
+            for page in range(1, self.harvest_pages + 1):
+                if not self.healthy or self.cancelled():
+                    return total
+                with stats.timer(f'{self.site}.harvest'):
+                    tree = self.get_etree(self.listing_url(link, page))
+                    uris = dict() if tree is None else self.parse_listing(tree)
+                if not uris:
+                    break
+                self.cache.set_uris(self.site, uris)
+                total += len(uris)
+            # 中途停止时不记为已收录, 下次运行继续
+            if self.cancelled():
+                return total
+            self.cache.set_harvested(self.site, link)
+        except Exception:
+            log(f'列表页收录失败: {self.site} {link}\n{traceback.format_exc()}',
+                'WARNING')
+        log(f'列表页收录完成: {self.site} {link}, 共{total}部')
+        stats.incr(f'{self.site}.harvested', total)
+        return total
+
+    def close(self):
+        # 未开始的收录任务直接取消, 进行中的在下一次请求或重试等待时停止
+        if self._harvester is not None:
+            self._closing.set()
+            self._harvester.shutdown(cancel_futures=True)
+            self._harvester = None
+            self._closing = threading.Event()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
     def get_movie_info(
             self,
             codename: str) -> Tuple[str, str, list, list]:  # type: ignore
         pass
 
-    def get_info(self, name: str) -> MovieInfo | None:
+    def get_info(self,
+                 name: str,
+                 cancel: threading.Event | None = None) -> MovieInfo | None:
+        # cancel: 设置后不再发出新的请求, 用于多站点同时查询
+        self._state.cancel = cancel
         # 检查是否已有缓存
-        if self.infos.get(name):
-            return self.infos[name]
-
+        info = self.infos.get(name)
+        if info:
+            return info
+        if self.cache is not None:
+            data = self.cache.get_info(self.site, name)
+            stats.incr(f'{self.site}.info_cache_' +
+                       ('miss' if data is None else 'hit'))
+            if data is not None:
+                log(f'命中缓存: {self.site} {name}')
+                info = self.infos[name] = MovieInfo(**data)
+                return info
+            # 近期查询失败过的番号, 等待期内直接跳过
+            miss = self.cache.get_miss(self.site, name)
+            if miss is not None:
+                stats.incr(f'{self.site}.negative_hit')
+                log(f'近期查询失败({miss["reason"]}, 第{miss["attempts"]}次), '
+                    f'跳过: {self.site} {name}')
+                return None
+
+        self._state.reason = None
+        self._state.links = list()
         info = None
-        result = self.get_codename(name)
-        codename = result[0] if isinstance(result, tuple) else result
-        if codename is not None:
-            uri = result[1] if isinstance(result, tuple) else codename
-
-            info = MovieInfo()
-            info.codename = codename
-            info.title, info.director, info.actors, info.tags = self.get_movie_info(
-                uri)
-        self.infos[codename] = info
+        try:
+            # 列表页中已收录的番号可省去搜索请求
+            result = None if self.cache is None else self.cache.get_uri(
+                self.site, name)
+            if self.cache is not None:
+                stats.incr(f'{self.site}.uri_cache_' +
+                           ('miss' if result is None else 'hit'))
+            if result is not None:
+                if result[0] == result[1]:
+                    result = result[0]
+            else:
+                with stats.timer(f'{self.site}.search'):
+                    result = self.get_codename(name)
+            codename = result[0] if isinstance(result, tuple) else result
+            if codename is not None:
+                uri = result[1] if isinstance(result, tuple) else codename
+
+                info = MovieInfo()
+                info.codename = codename
+                with stats.timer(f'{self.site}.detail'):
+                    info.title, info.director, info.actors, info.tags = self.get_movie_info(
+                        uri)
+        except Exception:
+            self.record_miss(name, 'parse')
+            raise
+        if info is None:
+            # 搜索无结果或详情页获取失败时记录失败原因, 不写入信息缓存
+            self.record_miss(name)
+        elif info.title == MovieInfo.default_text:
+            # 详情页获取失败: 不完整的信息不返回也不缓存, 由其他站点或之后的运行重试
+            self.record_miss(name, 'parse')
+            return None
+        elif self.cache is not None:
+            self.cache.set_info(self.site, name, info.to_dict())
+            self.schedule_harvest(self._state.links)
+        self.infos[name] = self.infos[codename] = info
         return info
 
+    def record_miss(self, name: str, default: str = 'not_found'):
+        reason = getattr(self._state, 'reason', None) or default
+        if reason == 'cancelled':
+            return
+        stats.incr(f'{self.site}.miss_{reason}')
+        if self.cache is not None:
+            self.cache.set_miss(self.site, name, reason)
+
 
 class Javbus(Spider):
     baseurl = 'https://www.javbus.com'
+    # XPath在类定义时编译一次, 详情字段均相对于信息栏节点查询
+    xp_codes = XPath(
+        '//*[@id="waterfall"]/div[*]/a/div[2]/span/date[1]/text()')
+    xp_title = XPath('/html/body/div[5]/h3')
+    xp_info = XPath('/html/body/div[5]/div[1]/div[2]')
+    xp_director = XPath(
+        'p[*]/span[contains(text(), "導演")]/following::a[1]/text()')
+    xp_actors = XPath('p[*]/span/a/text()')
+    xp_tags = XPath('p[*]/span/label/a/text()')
+    xp_links = XPath(
+        'p[*]/span/a/@href | '
+        'p[*]/span[contains(text(), "系列")]/following::a[1]/@href')
+    xp_listing = XPath('//*[@id="waterfall"]/div/a')
+    xp_listing_code = XPath('div[2]/span/date[1]/text()')
 
     def get_codename(self, text: str) -> str | None:
 
@@ -155,10 +550,7 @@ class Javbus(Spider):
             if res_tree is None:
                 return list()
             else:
-                return [
-                    i.text for i in res_tree.xpath(
-                        '//*[@id="waterfall"]/div[*]/a/div[2]/span/date[1]')
-                ]
+                return [str(code) for code in self.xp_codes(res_tree)]
 
         code_list = _get_code_list(
             f"{self.baseurl}/search/{quote(text, encoding='utf-8')}")
@@ -179,46 +571,65 @@ class Javbus(Spider):
             return MovieInfo.default_text, MovieInfo.default_text, list(
             ), list()
 
-        web_title: str = res_tree.xpath('/html/body/div[5]/h3')[0].text
+        web_title: str = self.xp_title(res_tree)[0].text
         title = re.sub(f'{codename}\\s', '', web_title)
-        # other info: /html/body/div[5]/div[1]/div[2]/p[*]
-        try:
-            director = res_tree.xpath(
-                '/html/body/div[5]/div[1]/div[2]/p[*]/span[contains(text(), "導演")]/following::a'
-            )[0].text
-        except:
-            director = MovieInfo.default_text
-        try:
-            actors = [
-                actor.text for actor in res_tree.xpath(
-                    '/html/body/div[5]/div[1]/div[2]/p[*]/span/a')
-            ]
-        except:
-            actors = list()
-        try:
-            tags = [
-                tag.text for tag in res_tree.xpath(
-                    '/html/body/div[5]/div[1]/div[2]/p[*]/span/label/a')
-            ]
-        except:
-            tags = list()
-        return title, director, actors, tags
+        info_nodes = self.xp_info(res_tree)
+        if not info_nodes:
+            return title, MovieInfo.default_text, list(), list()
+        info_node = info_nodes[0]
+        director = next(iter(self.xp_director(info_node)),
+                        MovieInfo.default_text)
+        actors = [str(actor) for actor in self.xp_actors(info_node)]
+        tags = [str(tag) for tag in self.xp_tags(info_node)]
+        self._state.links = [
+            urlsplit(str(link)).path for link in self.xp_links(info_node)
+        ]
+        return title, str(director), actors, tags
+
+    def listing_url(self, link: str, page: int) -> str:
+        if page == 1:
+            return f'{self.baseurl}{link}'
+        return f'{self.baseurl}{link}/{page}'
+
+    def parse_listing(self, tree) -> Dict[str, str]:
+        # 详情页地址由番号直接拼出
+        uris = dict()
+        for node in self.xp_listing(tree):
+            code = self.xp_listing_code(node)
+            if code:
+                uris[str(code[0])] = str(code[0])
+        return uris
 
 
 class Javdb(Spider):
     baseurl = 'https://javdb.com'
+    xp_results = XPath('/html/body/section/div/div[6]/div/a')
+    xp_result_code = XPath('div[2]/strong/text()')
+    xp_title = XPath('/html/body/section/div/div[4]/h2/strong[2]')
+    xp_panel = XPath('/html/body/section/div/div[4]/div[1]/div/div[2]/nav')
+    xp_director = XPath(
+        'div/strong[contains(text(), "導演")]/following-sibling::span/a/text()'
+    )
+    xp_actors = XPath(
+        'div/strong[contains(text(), "演員")][1]/following-sibling::span/a')
+    xp_actor_gender = XPath('following-sibling::strong[1]/@class')
+    xp_tags = XPath(
+        'div/strong[contains(text(), "類別")][1]/following-sibling::span/a/text()'
+    )
+    xp_series = XPath(
+        'div/strong[contains(text(), "系列")]/following-sibling::span/a/@href')
+    xp_listing = XPath(
+        '//div[contains(@class, "movie-list")]/div/a')
 
     def get_codename(self, text: str) -> Tuple[str, str] | None:
 
         query_url = f"{self.baseurl}/search?q={quote(text, encoding='utf-8')}"
 
-        node_list = self.get_list_by_xpath(
-            query_url, '/html/body/section/div/div[6]/div')
-        code_url = {
-            node.xpath('a/div[2]/strong')[0].text:
-            node.xpath('a')[0].attrib['href']
-            for node in node_list
-        }
+        code_url = dict()
+        for node in self.get_list_by_xpath(query_url, self.xp_results):
+            code = self.xp_result_code(node)
+            if code:
+                code_url[str(code[0])] = node.get('href')
         code_list = list(code_url.keys())
         codename = get_most_like(text, code_list)
 
@@ -237,33 +648,33 @@ class Javdb(Spider):
             return MovieInfo.default_text, MovieInfo.default_text, list(
             ), list()
 
-        title = res_tree.xpath(
-            '/html/body/section/div/div[4]/h2/strong[2]')[0].text
-        # other_info = /html/body/section/div/div[4]/div[1]/div/div[2]
-        try:
-            director = res_tree.xpath(
-                '/html/body/section/div/div[4]/div[1]/div/div[2]/nav/div/strong[contains(text(), "導演")]/following-sibling::span/a'
-            )[0].text
-        except:
-            director = MovieInfo.default_text
-        try:
-            actor_nodes = res_tree.xpath(
-                '/html/body/section/div/div[4]/div[1]/div/div[2]/nav/div/strong[contains(text(), "演員")]'
-            )[0].xpath('following-sibling::span/a')
-            actors = [
-                actor.text for actor in actor_nodes if 'female' in actor.xpath(
-                    'following-sibling::strong')[0].attrib["class"]
-            ]
-        except:
-            actors = list()
-        try:
-            tag_nodes = res_tree.xpath(
-                '/html/body/section/div/div[4]/div[1]/div/div[2]/nav/div/strong[contains(text(), "類別")]'
-            )[0].xpath('following-sibling::span/a')
-            tags = [tag.text for tag in tag_nodes]
-        except:
-            tags = list()
-        return title, director, actors, tags
+        title = self.xp_title(res_tree)[0].text
+        panels = self.xp_panel(res_tree)
+        if not panels:
+            return title, MovieInfo.default_text, list(), list()
+        panel = panels[0]
+        director = next(iter(self.xp_director(panel)), MovieInfo.default_text)
+        actor_nodes = [
+            actor for actor in self.xp_actors(panel)
+            if 'female' in next(iter(self.xp_actor_gender(actor)), '')
+        ]
+        actors = [actor.text for actor in actor_nodes]
+        tags = [str(tag) for tag in self.xp_tags(panel)]
+        self._state.links = [
+            actor.get('href') for actor in actor_nodes if actor.get('href')
+        ] + [str(link) for link in self.xp_series(panel)]
+        return title, str(director), actors, tags
+
+    def listing_url(self, link: str, page: int) -> str:
+        return f'{self.baseurl}{link}?page={page}'
+
+    def parse_listing(self, tree) -> Dict[str, str]:
+        uris = dict()
+        for node in self.xp_listing(tree):
+            code = self.xp_result_code(node)
+            if code:
+                uris[str(code[0])] = node.get('href')
+        return uris
 
 
 if __name__ == "__main__":
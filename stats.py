@@ -0,0 +1,181 @@
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+# 抽样使用独立的随机数生成器, 不影响调用方设定的随机种子
+_random = random.Random()
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+# 单个阶段的耗时: 次数/总计/最大值精确记录, 分位数由固定容量的均匀抽样估计,
+# 内存占用不随样本数增长
+class Timing:
+
+    def __init__(self, size: int = 1024):
+        self.size = size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: List[float] = list()
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        # 蓄水池抽样: 每个样本被保留的概率相同
+        if len(self.samples) < self.size:
+            self.samples.append(seconds)
+        else:
+            idx = _random.randrange(self.count)
+            if idx < self.size:
+                self.samples[idx] = seconds
+
+    def merge(self, data: dict):
+        count = self.count + data['count']
+        if len(self.samples) + len(data['samples']) > self.size:
+            # 按两边的样本总数比例各取一部分
+            mine = min(len(self.samples),
+                       round(self.size * self.count / count))
+            theirs = min(len(data['samples']), self.size - mine)
+            self.samples = (_random.sample(self.samples, mine) +
+                            _random.sample(data['samples'], theirs))
+        else:
+            self.samples.extend(data['samples'])
+        self.count = count
+        self.total += data['total']
+        self.max = max(self.max, data['max'])
+
+    def to_dict(self) -> dict:
+        return dict(count=self.count,
+                    total=self.total,
+                    max=self.max,
+                    samples=list(self.samples))
+
+
+# 记录各阶段耗时/次数/字节数, 运行结束时输出汇总表
+class Stats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings: Dict[str, Timing] = dict()
+        self.counters: Dict[str, int] = dict()
+        self.sizes: Dict[str, int] = dict()
+        self.started = time.perf_counter()
+
+    def reset(self):
+        with self._lock:
+            self.timings.clear()
+            self.counters.clear()
+            self.sizes.clear()
+            self.started = time.perf_counter()
+
+    def dump(self) -> dict:
+        # 原始数据, 供子进程回传后由主进程合并
+        with self._lock:
+            return dict(timings={k: v.to_dict()
+                                 for k, v in self.timings.items()},
+                        counters=dict(self.counters),
+                        sizes=dict(self.sizes))
+
+    def merge(self, data: dict):
+        with self._lock:
+            for stage, timing in data['timings'].items():
+                self.timings.setdefault(stage, Timing()).merge(timing)
+            for name, value in data['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for stage, size in data['sizes'].items():
+                self.sizes[stage] = self.sizes.get(stage, 0) + size
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            timing = self.timings.get(stage)
+            if timing is None:
+                timing = self.timings[stage] = Timing()
+            timing.add(seconds)
+
+    def add_bytes(self, stage: str, size: int):
+        with self._lock:
+            self.sizes[stage] = self.sizes.get(stage, 0) + size
+
+    def incr(self, name: str, count: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def timed_iter(self, stage: str, items: Iterable[T]) -> Iterator[T]:
+        # 统计生成器每次产出所花费的时间
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - start)
+                return
+            self.add_time(stage, time.perf_counter() - start)
+            yield item
+
+    def hit_rate(self, name: str) -> float | None:
+        hits = self.counters.get(f'{name}_hit', 0)
+        total = hits + self.counters.get(f'{name}_miss', 0)
+        return hits / total if total else None
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = {
+                stage: dict(count=timing.count,
+                            total=round(timing.total, 4),
+                            p50=round(percentile(timing.samples, 50), 4),
+                            p95=round(percentile(timing.samples, 95), 4),
+                            max=round(timing.max, 4),
+                            bytes=self.sizes.get(stage, 0))
+                for stage, timing in sorted(self.timings.items())
+            }
+            counters = dict(sorted(self.counters.items()))
+        return dict(elapsed=round(time.perf_counter() - self.started, 4),
+                    stages=stages,
+                    counters=counters)
+
+    def summary(self) -> str:
+        report = self.to_dict()
+        lines = [
+            f'{"stage":<24}{"count":>8}{"total":>10}{"p50":>10}'
+            f'{"p95":>10}{"max":>10}{"bytes":>14}'
+        ]
+        for stage, item in report['stages'].items():
+            lines.append(f'{stage:<24}{item["count"]:>8}{item["total"]:>10.3f}'
+                         f'{item["p50"]:>10.3f}{item["p95"]:>10.3f}'
+                         f'{item["max"]:>10.3f}{item["bytes"]:>14}')
+        for name, value in report['counters'].items():
+            lines.append(f'{name:<24}{value:>8}')
+        names = {name.rsplit('_', 1)[0] for name in report['counters']
+                 if name.endswith(('_hit', '_miss'))}
+        for name in sorted(names):
+            lines.append(f'{name + " hit rate":<24}{self.hit_rate(name):>8.1%}')
+        lines.append(f'{"elapsed":<24}{report["elapsed"]:>8.2f}s')
+        return '\n'.join(lines)
+
+    def export(self, path: str):
+        with open(path, 'w', encoding='utf-8') as fp:
+            json.dump(self.to_dict(), fp, ensure_ascii=False, indent=2)
+
+
+stats = Stats()
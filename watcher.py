@@ -0,0 +1,235 @@
+import os
+import sys
+import abc
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from typing import Dict, Iterator, List, Set, Tuple
+
+from exts import log, file_scanner
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+# 监视源文件夹下新增/变化的影片文件, poll() 返回自上次调用以来的候选路径
+class Watcher(abc.ABC):
+
+    def __init__(self,
+                 root: str,
+                 include: list,
+                 marks: Tuple[str, ...] = ('gavdener.ignore', ),
+                 exclude: Tuple[str, ...] = (),
+                 interval: float = 5.0):
+        self.root = root
+        self.include = include
+        self.marks = marks
+        self.exclude = exclude
+        self.interval = interval
+
+    def accept(self, path: str) -> bool:
+        if os.path.splitext(path)[1] not in self.include or any(
+                path.startswith(os.path.join(dirpath, ''))
+                for dirpath in self.exclude):
+            return False
+        # 源文件夹内到该文件所在目录为止, 任一级存在标记文件则跳过
+        dirpath = os.path.dirname(path)
+        while dirpath.startswith(self.root):
+            if any(
+                    os.path.exists(os.path.join(dirpath, name))
+                    for name in self.marks):
+                return False
+            parent = os.path.dirname(dirpath)
+            if parent == dirpath:
+                break
+            dirpath = parent
+        return True
+
+    @abc.abstractmethod
+    def poll(self, timeout: float) -> List[str]:
+        pass
+
+    def close(self):
+        pass
+
+
+# 定时遍历源文件夹, 与上次结果比较大小和修改时间
+class PollingWatcher(Watcher):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._seen: Dict[str, Tuple[int, float]] = dict()
+        self._last = 0.0
+        # 启动前已存在的文件由首次整理处理, 此处只记录状态
+        for _ in self._scan():
+            pass
+
+    def _scan(self) -> Iterator[str]:
+        current = dict()
+        for path in file_scanner(target_dir=self.root,
+                                 include=self.include,
+                                 ignore_file=self.marks[0]):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            current[path] = (stat.st_size, stat.st_mtime)
+            if self._seen.get(path) != current[path]:
+                yield path
+        self._seen = current
+
+    def poll(self, timeout: float) -> List[str]:
+        wait = self._last + self.interval - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if wait > timeout:
+                return list()
+        self._last = time.monotonic()
+        return [path for path in self._scan() if self.accept(path)]
+
+
+# 基于 inotify 的监视(仅 Linux), 新建的子目录会自动加入监视
+class InotifyWatcher(Watcher):
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    # 与 Linux 的 O_NONBLOCK/O_CLOEXEC 取值相同
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE |
+                  IN_DELETE_SELF | IN_MOVE_SELF)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p,
+                                    ctypes.c_uint32)
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs: Dict[int, str] = dict()
+        self._watch_tree(self.root)
+
+    def _watch(self, dirpath: str) -> bool:
+        wd = self._add_watch(self._fd, os.fsencode(dirpath), self.WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, '超出inotify监视数量上限')
+            return False
+        self._dirs[wd] = dirpath
+        return True
+
+    def _watch_tree(self, root: str) -> List[str]:
+        # 为目录树中的各目录添加监视, 返回其中已有的文件
+        files = list()
+        for dirpath, dirnames, filenames in os.walk(root):
+            if not self._watch(dirpath):
+                dirnames.clear()
+                continue
+            files.extend(os.path.join(dirpath, name) for name in filenames)
+        return files
+
+    def _read(self, timeout: float) -> List[Tuple[int, int, str]]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return list()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return list()
+        events, offset = list(), 0
+        while offset < len(data):
+            wd, mask, _, size = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + size].rstrip(b'\0'))
+            offset += size
+            events.append((wd, mask, name))
+        return events
+
+    def poll(self, timeout: float) -> List[str]:
+        paths: Set[str] = set()
+        for wd, mask, name in self._read(timeout):
+            if mask & self.IN_Q_OVERFLOW:
+                # 事件队列溢出, 重新遍历整个源文件夹
+                log('inotify事件队列溢出, 重新扫描源文件夹', 'WARNING')
+                paths.update(
+                    file_scanner(target_dir=self.root,
+                                 include=self.include,
+                                 ignore_file=self.marks[0]))
+                continue
+            if mask & (self.IN_IGNORED | self.IN_DELETE_SELF |
+                       self.IN_MOVE_SELF):
+                self._dirs.pop(wd, None)
+                continue
+            dirpath = self._dirs.get(wd)
+            if dirpath is None or not name:
+                continue
+            path = os.path.join(dirpath, name)
+            if mask & self.IN_ISDIR:
+                # 整个目录被移入或新建, 目录中已有的文件一并处理
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    paths.update(self._watch_tree(path))
+            else:
+                paths.add(path)
+        return [path for path in sorted(paths) if self.accept(path)]
+
+    def close(self):
+        os.close(self._fd)
+
+
+# 文件大小与修改时间在 settle 秒内保持不变才视为写入完成
+class Debouncer:
+
+    def __init__(self, settle: float = 30.0):
+        self.settle = settle
+        self._pending: Dict[str, Tuple[int, float, float]] = dict()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, path: str):
+        self._pending.setdefault(path, (-1, 0.0, time.monotonic()))
+
+    def ready(self) -> List[str]:
+        now, result = time.monotonic(), list()
+        for path, (size, mtime, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                self._pending[path] = (stat.st_size, stat.st_mtime, now)
+            elif now - since >= self.settle:
+                del self._pending[path]
+                result.append(path)
+        return sorted(result)
+
+
+def get_watcher(root: str,
+                include: list,
+                marks: Tuple[str, ...] = ('gavdener.ignore', ),
+                exclude: Tuple[str, ...] = (),
+                interval: float = 5.0,
+                polling: bool = False) -> Watcher:
+    if not polling and sys.platform == 'linux':
+        try:
+            watcher = InotifyWatcher(root, include, marks, exclude, interval)
+            log(f'使用inotify监视: {root}')
+            return watcher
+        except (OSError, AttributeError):
+            log('inotify不可用, 改为定时扫描', 'WARNING')
+    log(f'定时扫描: {root}, 间隔{interval}s')
+    return PollingWatcher(root, include, marks, exclude, interval)